@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of the cache key of a command, per number of dependencies
+
+    python3 benchmark/bench_action_digest.py [--max-deps 10000] [--repeat 5] [--algo sha1]
+
+"legacy" is the old key: the dependency digests folded into the command hash
+with byte_xor. "collisions" counts the keys (of 1000 dependency sets) that
+stay the same after two dependencies swap their contents.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from umake.action_digest import action_digest
+from umake.hashing import ALGORITHMS, Hasher
+
+
+def byte_xor(ba1, ba2):
+    return bytes([_a ^ _b for _a, _b in zip(ba1, ba2)])
+
+
+def legacy_digest(hasher, cmd_hash, deps):
+    deps_hash = cmd_hash
+    for _, digest in deps:
+        deps_hash = byte_xor(deps_hash, digest)
+    return deps_hash
+
+
+def measure(digest, hasher, cmd_hash, deps, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        digest(hasher, cmd_hash, deps)
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best
+
+
+def swapped_collisions(digest, hasher, cmd_hash):
+    collisions = 0
+    for idx in range(1000):
+        paths = [f"/src/dir{idx}/file{n}.h" for n in range(4)]
+        deps = {path: hasher.hash_bytes(f"{idx} {path}".encode()) for path in paths}
+        swapped = dict(deps)
+        swapped[paths[0]], swapped[paths[1]] = deps[paths[1]], deps[paths[0]]
+        if digest(hasher, cmd_hash, deps.items()) == digest(hasher, cmd_hash, swapped.items()):
+            collisions += 1
+    return collisions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-deps", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--algo", default="sha1", choices=sorted(ALGORITHMS))
+    args = parser.parse_args()
+
+    hasher = Hasher(args.algo)
+    cmd_hash = hasher.hash_bytes(b"gcc -c a.c -o a.o")
+    print(f"{args.algo}, best of {args.repeat}")
+    print(f"{'deps':>8} {'legacy [ms]':>12} {'digest [ms]':>12} {'speedup':>8}")
+    n_deps = 10
+    while n_deps <= args.max_deps:
+        # a set, in no particular order, like the dependencies of a command
+        deps = {(f"/usr/include/dir{idx % 50}/header{idx}.h", hasher.hash_bytes(str(idx).encode()))
+                for idx in range(n_deps)}
+        legacy = measure(legacy_digest, hasher, cmd_hash, deps, args.repeat)
+        new = measure(action_digest, hasher, cmd_hash, deps, args.repeat)
+        print(f"{n_deps:8} {legacy * 1000:12.3f} {new * 1000:12.3f} {legacy / new:8.1f}")
+        n_deps *= 10
+
+    print(f"\nkeys unchanged by swapping the contents of two dependencies (of 1000): "
+          f"legacy {swapped_collisions(legacy_digest, hasher, cmd_hash)}, "
+          f"digest {swapped_collisions(action_digest, hasher, cmd_hash)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compression of packed action results (umake.artifact) per codec
+
+    python3 benchmark/bench_artifact.py [--dir BUILT_DIR] [--repeat 5]
+
+by default the example project is built (gcc) in a temp dir and the targets
+of every command are packed as umake uploads them. With --dir every file
+under BUILT_DIR is packed as the result of its own command. "requests" is
+the number of remote cache objects per build: before packing every target
+was an object.
+"""
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import umake.artifact as artifact
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example")
+
+
+def build_example(build_dir):
+    """ the commands of example/UMakefile, returns [[targets of a command]] """
+    cmds = []
+    objs = []
+    for name in sorted(os.listdir(EXAMPLE_DIR)):
+        if not name.endswith(".c"):
+            continue
+        shutil.copy(os.path.join(EXAMPLE_DIR, name), build_dir)
+        obj = os.path.join(build_dir, name[:-2] + ".o")
+        subprocess.check_call(["gcc", "-c", os.path.join(build_dir, name), "-o", obj])
+        objs.append(obj)
+        cmds.append([obj])
+    exe = os.path.join(build_dir, "hello_world")
+    subprocess.check_call(["gcc"] + objs + ["-o", exe])
+    cmds.append([exe])
+    return cmds
+
+
+def dir_cmds(built_dir):
+    cmds = []
+    for root, _, files in os.walk(built_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                cmds.append([path])
+    return cmds
+
+
+def measure(cmds, codec, unpack_dir, repeat):
+    best_pack = best_unpack = None
+    packed_size = 0
+    for _ in range(repeat):
+        packed = []
+        start = time.perf_counter()
+        for targets in cmds:
+            out = io.BytesIO()
+            artifact.pack([(target, target, os.stat(target).st_mode) for target in targets], out, codec)
+            packed.append(out.getvalue())
+        took = time.perf_counter() - start
+        best_pack = took if best_pack is None else min(best_pack, took)
+        packed_size = sum(len(data) for data in packed)
+
+        start = time.perf_counter()
+        for targets, data in zip(cmds, packed):
+            dests = {target: os.path.join(unpack_dir, str(idx)) for idx, target in enumerate(targets)}
+            artifact.unpack(io.BytesIO(data), dests)
+        took = time.perf_counter() - start
+        best_unpack = took if best_unpack is None else min(best_unpack, took)
+    return packed_size, best_pack, best_unpack
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", help="built tree to pack instead of the example project")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-artifact-")
+    try:
+        cmds = dir_cmds(args.dir) if args.dir else build_example(tmp_dir)
+        unpack_dir = os.path.join(tmp_dir, "unpack")
+        os.mkdir(unpack_dir)
+        raw_size = sum(os.stat(target).st_size for targets in cmds for target in targets)
+        n_targets = sum(len(targets) for targets in cmds)
+        codecs = [artifact.CODEC_RAW, artifact.CODEC_ZLIB]
+        if artifact.zstandard is not None:
+            codecs.append(artifact.CODEC_ZSTD)
+
+        print(f"{len(cmds)} commands, {n_targets} targets, {raw_size / 1024:.1f}KB, "
+              f"requests {n_targets} per target, {len(cmds)} packed")
+        print(f"{'codec':6} {'packed [KB]':>12} {'ratio':>7} {'pack [MB/s]':>12} {'unpack [MB/s]':>14}")
+        for codec in codecs:
+            packed_size, pack_took, unpack_took = measure(cmds, codec, unpack_dir, args.repeat)
+            raw_mb = raw_size / 1024 / 1024
+            print(f"{artifact.CODEC_NAMES[codec]:6} {packed_size / 1024:12.1f} {raw_size / packed_size:7.2f} "
+                  f"{raw_mb / pack_took:12.1f} {raw_mb / unpack_took:14.1f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
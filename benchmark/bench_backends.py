@@ -0,0 +1,101 @@
+"""
+Throughput of the cache backends (umake.cache_backend)
+
+    python3 benchmark/bench_backends.py [--n-objects 200] [--size-kb 64] [--threads 8] [--latency 0]
+
+every backend stores and reads back the same objects from <threads> threads
+sharing one backend (one connection pool), as the workers of a build do. The
+network backends (http, minio) talk to test/s3_server.py started on a free
+port, --latency delays its every request to act like a far away server.
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from umake.cache_backend import create_backend
+
+S3_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "s3_server.py")
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for_port(port, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"s3_server didn't start on port {port}")
+
+
+def measure(backend, names, data, threads):
+    def put(name):
+        backend.put(name, BytesIO(data), len(data))
+
+    def get(name):
+        f = backend.get(name)
+        try:
+            assert len(f.read()) == len(data)
+        finally:
+            f.close()
+
+    took = dict()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for op, func in (("put", put), ("get", get)):
+            start = time.perf_counter()
+            list(pool.map(func, names))
+            took[op] = time.perf_counter() - start
+    return took
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-objects", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-backends-")
+    port = free_port()
+    server = subprocess.Popen([sys.executable, S3_SERVER, str(port), os.path.join(tmp_dir, "s3"),
+                               "--latency", str(args.latency)])
+    try:
+        wait_for_port(port)
+        specs = [f"shared:{os.path.join(tmp_dir, 'shared')}",
+                 f"http://127.0.0.1:{port}/bench",
+                 f"minio://127.0.0.1:{port}"]
+        data = os.urandom(args.size_kb * 1024)
+        total_mb = args.n_objects * len(data) / 1024 / 1024
+        print(f"{args.n_objects} objects of {args.size_kb}KB, {args.threads} threads, latency {args.latency}s")
+        print(f"{'backend':8} {'put [MB/s]':>11} {'put [op/s]':>11} {'get [MB/s]':>11} {'get [op/s]':>11}")
+        for spec in specs:
+            backend = create_backend(spec, args.threads)
+            names = [f"{spec.split(':')[0]}-{idx}" for idx in range(args.n_objects)]
+            took = measure(backend, names, data, args.threads)
+            print(f"{spec.split(':')[0]:8} {total_mb / took['put']:11.1f} {args.n_objects / took['put']:11.0f} "
+                  f"{total_mb / took['get']:11.1f} {args.n_objects / took['get']:11.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
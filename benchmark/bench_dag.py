@@ -0,0 +1,134 @@
+"""
+Scaling of the build graph backend (umake.dag.Dag)
+
+    python3 benchmark/bench_dag.py [--sizes 10000 100000 1000000]
+
+the graph mimics a C project: every source has a compile command and an
+object, every compile command reads a few shared headers and every 100
+objects are linked together. When python-igraph is installed, name lookups
+are compared with igraph's vs.find() used before.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from umake.dag import Dag
+
+N_HEADERS_PER_CMD = 4
+OBJS_PER_LINK = 100
+
+
+def build_graph_spec(n_nodes):
+    n_sources = n_nodes // 3
+    n_headers = max(10, n_sources // 50)
+    headers = [f"/src/include/h{idx}.h" for idx in range(n_headers)]
+    nodes = list(headers)
+    edges = list()
+    for idx in range(n_sources):
+        src = f"/src/s{idx}.c"
+        cmd = f"gcc -c {src} -o /src/s{idx}.o"
+        obj = f"/src/s{idx}.o"
+        nodes += [src, cmd, obj]
+        edges.append((src, cmd))
+        edges.append((cmd, obj))
+        for header in random.sample(headers, N_HEADERS_PER_CMD):
+            edges.append((header, cmd))
+    for idx in range(0, n_sources, OBJS_PER_LINK):
+        cmd = f"ld -o /src/lib{idx}.so"
+        lib = f"/src/lib{idx}.so"
+        nodes += [cmd, lib]
+        edges.append((cmd, lib))
+        for obj_idx in range(idx, min(idx + OBJS_PER_LINK, n_sources)):
+            edges.append((f"/src/s{obj_idx}.o", cmd))
+    return nodes, edges
+
+
+class Timed:
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.results[self.name] = time.perf_counter() - self.start
+
+
+def bench_dag(nodes, edges):
+    results = dict()
+    dag = Dag()
+    with Timed(results, "build"):
+        dag.add_nodes(nodes)
+        dag.add_edges(edges)
+
+    with Timed(results, "pred+succ all nodes"):
+        for node in nodes:
+            dag.predecessors(node)
+            dag.successors(node)
+
+    with Timed(results, "edge check all edges"):
+        for from_node, to_node in edges:
+            dag.has_edge(from_node, to_node)
+
+    # incremental: new sources added one by one, each edge keeps the order up to date
+    with Timed(results, "add 1000 cmds (incremental)"):
+        for idx in range(1000):
+            src = f"/src/new{idx}.c"
+            cmd = f"gcc -c {src}"
+            obj = f"/src/new{idx}.o"
+            dag.add_node(src)
+            dag.add_node(cmd)
+            dag.add_node(obj)
+            dag.add_edge(obj, "ld -o /src/lib0.so")
+            dag.add_edge(cmd, obj)
+            dag.add_edge(src, cmd)
+
+    with Timed(results, "topological sort"):
+        dag.topological_sort()
+
+    removed = random.sample(nodes, len(nodes) // 100)
+    with Timed(results, "remove 1% nodes (batch)"):
+        dag.remove_nodes(removed)
+    return results
+
+
+def bench_igraph_lookups(nodes, edges, n_lookups):
+    import igraph
+    graph = igraph.Graph(directed=True)
+    graph.add_vertices(nodes)
+    graph.add_edges(edges)
+    sample = random.sample(nodes, n_lookups)
+    start = time.perf_counter()
+    for node in sample:
+        graph.vs.find(node).predecessors()
+    return (time.perf_counter() - start) / n_lookups
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--igraph-lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(0)
+    for n_nodes in args.sizes:
+        nodes, edges = build_graph_spec(n_nodes)
+        results = bench_dag(nodes, edges)
+        print(f"{len(nodes)} nodes, {len(edges)} edges")
+        for name, took in results.items():
+            print(f"    {name:30} {took:8.3f}[sec]")
+        per_lookup = results["pred+succ all nodes"] / len(nodes) / 2
+        print(f"    {'lookup':30} {per_lookup * 1e6:8.2f}[usec]")
+        try:
+            igraph_lookup = bench_igraph_lookups(nodes, edges, args.igraph_lookups)
+            print(f"    {'igraph vs.find lookup':30} {igraph_lookup * 1e6:8.2f}[usec]")
+        except ImportError:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Wall time of a compile heavy project, dependencies discovered by strace vs. by compiler depfiles
+
+    python3 benchmark/bench_depfile.py [--n-sources 200] [--n-headers 50] [--repeat 3]
+
+every source includes all the headers and a chunk of code that keeps the
+compiler busy, each build is from scratch with caches disabled.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+UMAKE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UMAKE = os.path.join(UMAKE_DIR, "umake", "umake")
+
+TRACED = ":foreach src/*.c > gcc -O2 -Iinclude -c {filename} -o {target} > obj/{noext}.o\n"
+DEPFILE = ":foreach src/*.c > gcc -O2 -Iinclude -MD -MF {depfile} -c {filename} -o {target} > obj/{noext}.o\n"
+LINK = ": obj/*.o > gcc {filename} -o {target} > app\n"
+
+
+def create_project(root, n_sources, n_headers):
+    os.makedirs(os.path.join(root, "include"))
+    os.makedirs(os.path.join(root, "src"))
+    os.makedirs(os.path.join(root, "obj"))
+    includes = ""
+    for idx in range(n_headers):
+        with open(os.path.join(root, "include", f"h{idx}.h"), "w") as f:
+            f.write(f"#pragma once\n#include <stdio.h>\n#include <string.h>\n#include <stdlib.h>\n"
+                    f"static inline int h{idx}(int x) {{ return x * {idx + 1}; }}\n")
+        includes += f'#include "h{idx}.h"\n'
+    for idx in range(n_sources):
+        body = "".join(f"    acc += h{h_idx}(acc ^ i) % {h_idx + 7};\n" for h_idx in range(n_headers))
+        with open(os.path.join(root, "src", f"s{idx}.c"), "w") as f:
+            f.write(f"{includes}\nint s{idx}(int n) {{\n    int acc = {idx};\n    for (int i = 0; i < n; i++) {{\n"
+                    f"{body}    }}\n    return acc;\n}}\n")
+    with open(os.path.join(root, "src", "main.c"), "w") as f:
+        f.write("int main() { return 0; }\n")
+
+
+def build(root, umakefile):
+    with open(os.path.join(root, "UMakefile"), "w") as f:
+        f.write(umakefile)
+    shutil.rmtree(os.path.join(root, ".umake"), ignore_errors=True)
+    for obj in os.listdir(os.path.join(root, "obj")):
+        os.remove(os.path.join(root, "obj", obj))
+    env = dict(os.environ, PYTHONPATH=UMAKE_DIR)
+    start = time.perf_counter()
+    subprocess.check_output([sys.executable, UMAKE, "--no-remote-cache", "--no-local-cache"], cwd=root, env=env)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-sources", type=int, default=200)
+    parser.add_argument("--n-headers", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # umake ignores paths under /tmp when tracing, keep the project out of it
+    root = tempfile.mkdtemp(prefix="umake-bench-depfile-", dir=os.path.expanduser("~"))
+    try:
+        create_project(root, args.n_sources, args.n_headers)
+        results = dict()
+        for name, rule in [("strace", TRACED), ("depfile", DEPFILE)]:
+            results[name] = min(build(root, rule + LINK) for _ in range(args.repeat))
+        print(f"{args.n_sources} sources, {args.n_headers} headers each")
+        for name, took in results.items():
+            print(f"    {name:10} {took:8.3f}[sec]")
+        print(f"    {'speedup':10} {results['strace'] / results['depfile']:8.2f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of file content hashing, throughput per algorithm
+
+    python3 benchmark/bench_hash.py [--large-mb 512] [--small-kb 4] [--n-small 2000]
+
+"legacy" is the old FileEntry.file_md5sum: read() the whole file, then sha1
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from umake.hashing import ALGORITHMS, Hasher
+
+
+def legacy_md5sum(full_path):
+    with open(full_path, "rb") as file_to_check:
+        return hashlib.sha1(file_to_check.read()).digest()
+
+
+def create_file(path, size):
+    chunk = os.urandom(min(size, 1024 * 1024))
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            f.write(chunk[:size - written])
+            written += len(chunk)
+
+
+def measure(hash_file, paths, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            hash_file(path)
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--large-mb", type=int, default=512)
+    parser.add_argument("--small-kb", type=int, default=4)
+    parser.add_argument("--n-small", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-hash-")
+    try:
+        large = os.path.join(tmp_dir, "large")
+        create_file(large, args.large_mb * 1024 * 1024)
+        small = []
+        for idx in range(args.n_small):
+            path = os.path.join(tmp_dir, f"small-{idx}")
+            create_file(path, args.small_kb * 1024)
+            small.append(path)
+
+        hashers = [("legacy", legacy_md5sum)]
+        hashers += [(algo, Hasher(algo).hash_file) for algo in sorted(ALGORITHMS)]
+
+        small_total_mb = args.n_small * args.small_kb / 1024
+        print(f"{'algorithm':10} {'large [MB/s]':>14} {'small [MB/s]':>14} {'small [files/s]':>16}")
+        for name, hash_file in hashers:
+            large_took = measure(hash_file, [large], args.repeat)
+            small_took = measure(hash_file, small, args.repeat)
+            print(f"{name:10} {args.large_mb / large_took:14.1f} {small_total_mb / small_took:14.1f} {args.n_small / small_took:16.0f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
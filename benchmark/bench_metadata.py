@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of the local cache metadata: md-<hash> files vs. the metadata store
+
+    python3 benchmark/bench_metadata.py [--n-actions 100000] [--n-deps 30] [--frontier 500]
+
+"legacy" is the old FsCache: a pickle file per command in the cache dir. The
+metadata of <n-actions> commands with <n-deps> dependencies each is saved,
+then all of it is read one command at a time, and by frontiers (commands
+ready together) of <frontier> commands through one query.
+"""
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from umake.metadata_store import MetadataStore
+
+
+def legacy_save(cache_dir, cache_hash, deps):
+    path = os.path.join(cache_dir, "md-" + cache_hash.hex())
+    with open(path + ".tmp", "wb") as f:
+        f.write(pickle.dumps(deps, protocol=pickle.HIGHEST_PROTOCOL))
+    os.rename(path + ".tmp", path)
+
+
+def legacy_open(cache_dir, cache_hash):
+    with open(os.path.join(cache_dir, "md-" + cache_hash.hex()), "rb") as f:
+        return pickle.load(f)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-actions", type=int, default=100000)
+    parser.add_argument("--n-deps", type=int, default=30)
+    parser.add_argument("--frontier", type=int, default=500)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-metadata-", dir=os.path.expanduser("~"))
+    try:
+        legacy_dir = os.path.join(tmp_dir, "legacy")
+        store_dir = os.path.join(tmp_dir, "store")
+        os.mkdir(legacy_dir)
+        os.mkdir(store_dir)
+        store = MetadataStore(store_dir)
+        hashes = [os.urandom(20) for _ in range(args.n_actions)]
+        deps = {f"/src/dir{idx % 100}/file{idx}.c" for idx in range(args.n_deps)} | \
+               {f"/usr/include/header{idx}.h" for idx in range(args.n_deps)}
+        frontiers = [hashes[start:start + args.frontier] for start in range(0, len(hashes), args.frontier)]
+
+        results = [
+            ("save", timed(lambda: [legacy_save(legacy_dir, h, deps) for h in hashes]),
+             timed(lambda: ([store.put(h, deps) for h in hashes], store.flush()))),
+            ("open one by one", timed(lambda: [legacy_open(legacy_dir, h) for h in hashes]),
+             timed(lambda: [store.get(h) for h in hashes])),
+            (f"open by {args.frontier}", None,
+             timed(lambda: [store.get_many(frontier) for frontier in frontiers])),
+        ]
+        print(f"{args.n_actions} commands, {len(deps)} deps each")
+        print(f"{'':20} {'legacy [s]':>11} {'store [s]':>10}")
+        for name, legacy, new in results:
+            legacy = "" if legacy is None else f"{legacy:.3f}"
+            print(f"{name:20} {legacy:>11} {new:10.3f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Build time of a wide project run by 1 to N `umake worker` processes
+
+    python3 benchmark/bench_remote_exec.py [--n-sources 64] [--max-workers 4] [--slots 2] [--work "sleep 0.2"]
+
+every one of <n-sources> independent commands runs <work> then copies its
+source. The project is built with no cache from scratch by 1, 2, .. <max-workers>
+workers on localhost (<slots> commands each) and once locally with as many jobs
+as one worker has. The default work waits rather than computes, so the scaling
+of the scheduling and the protocol shows on a host with few cpus too, give
+a compiler-like command (--work "python3 -c 'sum(range(10**7))'") on a host
+with enough cpus.
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UMAKE = os.path.join(REPO_DIR, "umake", "umake")
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_listening(port):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    raise RuntimeError(f"worker on port {port} didn't start")
+
+
+def build(project, env, args):
+    shutil.rmtree(os.path.join(project, ".umake"), ignore_errors=True)
+    for name in os.listdir(project):
+        if name.endswith(".out"):
+            os.remove(os.path.join(project, name))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, UMAKE, "--no-remote-cache", "--no-local-cache"] + args, cwd=project, env=env,
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-sources", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--slots", type=int, default=2)
+    parser.add_argument("--work", default="sleep 0.2")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-remote-exec-", dir=os.path.expanduser("~"))
+    workers = []
+    try:
+        project = os.path.join(tmp_dir, "project")
+        os.mkdir(project)
+        for idx in range(args.n_sources):
+            with open(os.path.join(project, f"s{idx}.txt"), "w") as f:
+                f.write(f"{idx}\n")
+        with open(os.path.join(project, "UMakefile"), "w") as f:
+            f.write(f":foreach *.txt > {args.work}; cp {{filename}} {{target}} > {{dir}}/{{noext}}.out\n")
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+
+        ports = [free_port() for _ in range(args.max_workers)]
+        for idx, port in enumerate(ports):
+            workers.append(subprocess.Popen([sys.executable, UMAKE, "worker", "--listen", f"127.0.0.1:{port}",
+                                             "--slots", str(args.slots), "--dir", os.path.join(tmp_dir, f"worker{idx}")],
+                                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        for port in ports:
+            wait_listening(port)
+
+        print(f"{args.n_sources} commands of '{args.work}', {args.slots} slots per worker")
+        print(f"{'':16} {'time [s]':>9} {'speedup':>8}")
+        local = build(project, env, ["-j", str(args.slots)])
+        print(f"{'local':16} {local:9.2f} {1:8.2f}")
+        for n_workers in range(1, args.max_workers + 1):
+            remote_workers = ",".join(f"127.0.0.1:{port}" for port in ports[:n_workers])
+            took = build(project, env, ["--remote-workers", remote_workers])
+            print(f"{f'{n_workers} workers':16} {took:9.2f} {local / took:8.2f}")
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
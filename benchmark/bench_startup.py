@@ -0,0 +1,66 @@
+"""
+Time to exit of umake commands that have nothing (or little) to do
+
+    python3 benchmark/bench_startup.py [--n-sources 200] [--repeat 10]
+
+a project of <n-sources> commands is built once, then every command is run
+<repeat> times and the median wall time is shown: what an editor hook calling
+umake after every save waits for. The remote cache is a shared dir tier, so
+the remote cache is configured but no server is needed.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UMAKE = os.path.join(REPO_DIR, "umake", "umake")
+
+
+def run(args, cwd, env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, UMAKE] + args, cwd=cwd, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-sources", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-startup-", dir=os.path.expanduser("~"))
+    try:
+        project = os.path.join(tmp_dir, "project")
+        os.mkdir(project)
+        for idx in range(args.n_sources):
+            with open(os.path.join(project, f"s{idx}.txt"), "w") as f:
+                f.write(f"{idx}\n")
+        with open(os.path.join(project, "UMakefile"), "w") as f:
+            f.write(":foreach *.txt > cp {filename} {target} > {dir}/{noext}.out\n")
+        env = dict(os.environ, PYTHONPATH=REPO_DIR, UMAKE_CACHE_TIERS=f"shared:{os.path.join(tmp_dir, 'shared')}")
+        run([], project, env)
+
+        commands = [
+            ("--help", ["--help"]),
+            ("no-op build", []),
+            ("no-op build --no-remote-cache", ["--no-remote-cache"]),
+            ("--show-all-targets", ["--show-all-targets"]),
+            ("--details <target>", ["--details", "s0.out"]),
+        ]
+        print(f"{args.n_sources} commands, median of {args.repeat} runs")
+        print(f"{'command':32} {'time [ms]':>10}")
+        for name, umake_args in commands:
+            took = [run(umake_args, project, env) for _ in range(args.repeat)]
+            print(f"{name:32} {statistics.median(took) * 1000:10.1f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Time and peak memory of umake's hot paths on a generated project
+
+    python3 benchmark/bench_suite.py [--n-dirs 20] [--n-files 25] [--n-headers 4] [--variant default]
+                                     [--repeat 3] [--json results.json] [--compare baseline.json]
+
+the project has <n-dirs> directories (each a [workdir] + [include] of its
+own UMakefile) of <n-files> sources. Every source is "compiled" by a :foreach
+rule reading it and the <n-headers> shared headers (fan-out of the headers),
+the objects of a directory are "linked" into one library (fan-in) and all the
+libraries are collected by a `**` rule at the root. The [variant] picks the
+flag the commands write.
+
+Every scenario runs <repeat> times, the median wall time, the peak RSS of
+umake (with its commands, as reported by wait4) and the time of every umake
+phase (from --trace) are reported:
+
+    cold                 nothing built, empty caches
+    no-op                nothing changed
+    touch source         one source changed
+    touch header         a header all the sources read changed
+    warm local cache     graph db and targets removed, local cache kept
+    warm remote cache    graph db, targets and local cache removed, the remote cache
+                         (a shared directory tier, standing in for a server) kept
+
+--json writes the results (with the parameters, the host and the git
+commit) for tracking between releases, --compare prints the ratio of every
+time to the one of an earlier --json.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UMAKE = os.path.join(REPO_DIR, "umake", "umake")
+PHASES = ["load_graph", "scan_fs", "parse_cmd_files", "execute_graph", "dump_graph", "cache_gc"]
+
+
+def create_project(project, n_dirs, n_files, n_headers):
+    headers = [f"include/h{idx}.h" for idx in range(n_headers)]
+    os.makedirs(os.path.join(project, "include"))
+    for header in headers:
+        with open(os.path.join(project, header), "w") as f:
+            f.write(f"{header}\n")
+    with open(os.path.join(project, "UMakefile"), "w") as f:
+        f.write("[variant:default]\n$flag = -O2\n\n")
+        f.write("[variant:debug]\n$flag = -O0\n\n")
+        # commands can't redirect (">" splits the rule) and run in '', sed writes the target
+        # the commands run in the directories of the sources
+        includes = " ".join(f"../{header}" for header in headers)
+        f.write(f"!cc(flag) : sed -n \"s/^/$flag /w {{target}}\" {{filename}} {includes}\n")
+        for idx in range(n_dirs):
+            f.write(f"[workdir:d{idx}]\n[include:UMakefile]\n")
+        f.write("[workdir:/]\n")
+        f.write(": **/*.lib > sed -n \"w {target}\" {filename} > all.bin\n")
+    for idx in range(n_dirs):
+        dir_path = os.path.join(project, f"d{idx}")
+        os.mkdir(dir_path)
+        for file_idx in range(n_files):
+            with open(os.path.join(dir_path, f"f{file_idx}.src"), "w") as f:
+                f.write(f"{idx} {file_idx}\n")
+        with open(os.path.join(dir_path, "UMakefile"), "w") as f:
+            f.write(":foreach *.src > !cc($flag) > {dir}/{noext}.obj\n")
+            f.write(": *.obj > sed -n \"w {target}\" {filename} > lib.lib\n")
+
+
+def remove_targets(project):
+    for dir_path, _, files in os.walk(project):
+        if ".umake" in dir_path:
+            continue
+        for name in files:
+            if name.endswith((".obj", ".lib", ".bin")):
+                os.remove(os.path.join(dir_path, name))
+
+
+def umake(project, env, args):
+    """ (wall seconds, peak rss KB, phase -> seconds) of one umake run """
+    trace = os.path.join(project, "..", "trace.json")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, UMAKE, "--trace", trace] + args, cwd=project, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(proc.pid, 0)
+    took = time.perf_counter() - start
+    # reaped here, Popen mustn't wait for it again
+    proc.returncode = status
+    if status != 0:
+        raise RuntimeError(f"umake {' '.join(args)} failed (wait status {status})")
+    with open(trace) as f:
+        events = json.load(f)["traceEvents"]
+    phases = {event["name"]: event["dur"] / 1e6 for event in events if event.get("cat") == "phase"}
+    return took, rusage.ru_maxrss, phases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-dirs", type=int, default=20)
+    parser.add_argument("--n-files", type=int, default=25)
+    parser.add_argument("--n-headers", type=int, default=4)
+    parser.add_argument("--variant", default="default")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", dest="json_file", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier --json to compare with")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-suite-", dir=os.path.expanduser("~"))
+    try:
+        project = os.path.join(tmp_dir, "project")
+        shared = os.path.join(tmp_dir, "shared")
+        umake_dir = os.path.join(project, ".umake")
+        os.mkdir(project)
+        create_project(project, args.n_dirs, args.n_files, args.n_headers)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR, UMAKE_CACHE_TIERS=f"shared:{shared}")
+        umake_args = ["--variant", args.variant]
+        source = os.path.join(project, "d0", "f0.src")
+        header = os.path.join(project, "include", "h0.h")
+        edits = [0]
+
+        def edit(path):
+            edits[0] += 1
+            with open(path, "a") as f:
+                f.write(f"edit {edits[0]}\n")
+
+        def cold():
+            shutil.rmtree(umake_dir, ignore_errors=True)
+            shutil.rmtree(shared, ignore_errors=True)
+            remove_targets(project)
+
+        def warm_local():
+            remove_targets(project)
+            os.remove(os.path.join(umake_dir, "db.sqlite"))
+
+        def warm_remote():
+            remove_targets(project)
+            shutil.rmtree(umake_dir)
+
+        # (name, preparation, extra arguments)
+        scenarios = [
+            ("cold", cold, []),
+            ("no-op", lambda: None, []),
+            ("touch source", lambda: edit(source), []),
+            ("touch header", lambda: edit(header), []),
+            ("warm local cache", warm_local, ["--no-remote-cache"]),
+            ("warm remote cache", warm_remote, []),
+        ]
+        umake(project, env, umake_args)
+        results = list()
+        for name, prepare, extra_args in scenarios:
+            runs = list()
+            for _ in range(args.repeat):
+                prepare()
+                runs.append(umake(project, env, umake_args + extra_args))
+            results.append({
+                "scenario": name,
+                "wall_s": statistics.median(run[0] for run in runs),
+                "max_rss_kb": max(run[1] for run in runs),
+                "phases_s": {phase: statistics.median(run[2].get(phase, 0.0) for run in runs) for phase in PHASES},
+            })
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    n_commands = args.n_dirs * (args.n_files + 1) + 1
+    print(f"{n_commands} commands ({args.n_dirs} dirs x {args.n_files} sources, {args.n_headers} headers), "
+          f"median of {args.repeat} runs, variant {args.variant}")
+    print(f"{'scenario':18} {'time [s]':>9} {'rss [MB]':>9} " + " ".join(f"{phase:>15}" for phase in PHASES))
+    for result in results:
+        print(f"{result['scenario']:18} {result['wall_s']:9.3f} {result['max_rss_kb'] / 1024:9.1f} " +
+              " ".join(f"{result['phases_s'][phase]:15.3f}" for phase in PHASES))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+        print(f"\ncompared with {args.compare} (new / old)")
+        print(f"{'scenario':18} {'time':>9} {'rss':>9}")
+        for result in results:
+            old = baseline.get(result["scenario"])
+            if old is None:
+                continue
+            print(f"{result['scenario']:18} {result['wall_s'] / old['wall_s']:9.2f} "
+                  f"{result['max_rss_kb'] / old['max_rss_kb']:9.2f}")
+
+    if args.json_file:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+        with open(args.json_file, "w") as f:
+            json.dump({
+                "params": {"n_dirs": args.n_dirs, "n_files": args.n_files, "n_headers": args.n_headers,
+                           "variant": args.variant, "repeat": args.repeat, "n_commands": n_commands},
+                "host": {"python": platform.python_version(), "platform": platform.platform(),
+                         "cpus": os.cpu_count()},
+                "commit": commit,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Matching source and manual dep patterns against the generated targets
+
+    python3 benchmark/bench_target_index.py [--n-targets 50000] [--n-dirs 500] [--n-patterns 1000]
+
+the targets are spread over <n-dirs> directories, the patterns are the kinds a
+UMakefile has (literal paths, <dir>/*.o, <dir>/**/*.o). Every target against
+every pattern with pywildcard.fnmatch (what UMakefile evaluation did) is
+compared to umake.target_index.TargetIndex.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from umake import pywildcard
+from umake.target_index import TargetIndex
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-targets", type=int, default=50000)
+    parser.add_argument("--n-dirs", type=int, default=500)
+    parser.add_argument("--n-patterns", type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    dirs = [f"/project/lib{idx // 20}/mod{idx}" for idx in range(args.n_dirs)]
+    targets = [f"{dirs[idx % args.n_dirs]}/obj{idx}.o" for idx in range(args.n_targets)]
+    patterns = []
+    for idx in range(args.n_patterns):
+        kind = idx % 3
+        if kind == 0:
+            patterns.append(random.choice(targets))
+        elif kind == 1:
+            patterns.append(f"{random.choice(dirs)}/*.o")
+        else:
+            patterns.append(f"{os.path.dirname(random.choice(dirs))}/**/*.o")
+
+    # a scan is slow, time a part of the patterns
+    n_scanned = max(1, args.n_patterns // 20)
+    start = time.perf_counter()
+    scanned = [{t for t in targets if pywildcard.fnmatch(t, p)} for p in patterns[:n_scanned]]
+    scan_took = (time.perf_counter() - start) * args.n_patterns / n_scanned
+
+    start = time.perf_counter()
+    index = TargetIndex(targets)
+    build_took = time.perf_counter() - start
+    start = time.perf_counter()
+    matched = [index.match(p) for p in patterns]
+    index_took = time.perf_counter() - start
+    assert matched[:n_scanned] == scanned
+
+    print(f"{args.n_targets} targets in {args.n_dirs} dirs, {args.n_patterns} patterns")
+    print(f"{'':24} {'time [ms]':>10}")
+    print(f"{'fnmatch every target':24} {scan_took * 1000:10.1f}")
+    print(f"{'index build':24} {build_took * 1000:10.1f}")
+    print(f"{'index match':24} {index_took * 1000:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Time umake spends evaluating the UMakefiles (the parse_cmd_files phase)
+
+    python3 benchmark/bench_umakefile.py [--n-dirs 100] [--lines 30] [--files 5] [--repeat 5]
+
+a tree of <n-dirs> directories is built once, each with <files> sources and
+an included UMakefile of <lines> lines (variables, a macro and a :foreach
+rule). Then the phase is timed from the --trace of builds that have nothing
+to do, after a source was added, after one included UMakefile changed and
+with the evaluation of the previous run dropped (what every run paid before
+it was cached).
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+UMAKE = os.path.join(REPO_DIR, "umake", "umake")
+
+
+def umake(project, env):
+    trace = os.path.join(project, "trace.json")
+    subprocess.run([sys.executable, UMAKE, "--no-remote-cache", "--trace", trace], cwd=project, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(trace) as f:
+        events = json.load(f)["traceEvents"]
+    return next(event["dur"] for event in events if event["name"] == "parse_cmd_files") / 1000
+
+
+def create_tree(project, n_dirs, lines, n_files):
+    with open(os.path.join(project, "UMakefile"), "w") as f:
+        for idx in range(n_dirs):
+            f.write(f"[workdir:d{idx}]\n[include:UMakefile]\n")
+    for idx in range(n_dirs):
+        dir_path = os.path.join(project, f"d{idx}")
+        os.mkdir(dir_path)
+        for file_idx in range(n_files):
+            with open(os.path.join(dir_path, f"f{file_idx}.txt"), "w") as f:
+                f.write(f"{idx} {file_idx}\n")
+        with open(os.path.join(dir_path, "UMakefile"), "w") as f:
+            for var_idx in range(lines - 2):
+                f.write(f"$v{var_idx} = d{idx} {var_idx}\n")
+            f.write("!copy(opt=-p) : cp $opt {filename} {target}\n")
+            f.write(":foreach *.txt > !copy() > {dir}/{noext}.out\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-dirs", type=int, default=100)
+    parser.add_argument("--lines", type=int, default=30)
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="umake-bench-umakefile-", dir=os.path.expanduser("~"))
+    try:
+        project = os.path.join(tmp_dir, "project")
+        os.mkdir(project)
+        create_tree(project, args.n_dirs, args.lines, args.files)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        umake(project, env)
+        umake(project, env)
+        new_source = os.path.join(project, "d0", "new.txt")
+        included = os.path.join(project, "d0", "UMakefile")
+        db = os.path.join(project, ".umake", "db.sqlite")
+
+        def no_op():
+            return umake(project, env)
+
+        def source_added():
+            with open(new_source, "w") as f:
+                f.write("new\n")
+            took = umake(project, env)
+            os.remove(new_source)
+            umake(project, env)
+            return took
+
+        def umakefile_changed():
+            with open(included, "a") as f:
+                f.write("$changed = 1\n")
+            return umake(project, env)
+
+        def not_cached():
+            conn = sqlite3.connect(db)
+            conn.execute("DELETE FROM meta WHERE key='umakefile_eval'")
+            conn.commit()
+            conn.close()
+            return umake(project, env)
+
+        print(f"{args.n_dirs} UMakefiles of {args.lines} lines, {args.n_dirs * args.files} commands, "
+              f"median of {args.repeat} runs")
+        print(f"{'build':24} {'parse_cmd_files [ms]':>21}")
+        for name, func in (("no-op", no_op), ("source added", source_added),
+                           ("UMakefile changed", umakefile_changed), ("not cached", not_cached)):
+            took = [func() for _ in range(args.repeat)]
+            print(f"{name:24} {statistics.median(took):21.1f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
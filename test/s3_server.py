@@ -0,0 +1,194 @@
+"""
+Stand-in for the minio remote cache, the subset of S3 umake uses: put, head, get, delete and list of objects.
+Also a stand-in for the http cache tier, plain PUT/GET of http://host:port/<prefix>/<name>
+
+    python3 s3_server.py <port> <data dir> [--latency SEC]
+
+requests are not authenticated, objects are stored as files under <data dir>/<bucket>/<object>,
+--latency delays every request to act like a far away server.
+"""
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+from email.utils import formatdate
+from hashlib import md5
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+META_PREFIX = "x-amz-meta-"
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _split(self):
+        url = urlparse(self.path)
+        parts = unquote(url.path).lstrip("/").split("/", 1)
+        bucket = parts[0]
+        key = parts[1] if len(parts) > 1 else ""
+        return bucket, key, parse_qs(url.query, keep_blank_values=True)
+
+    def _path(self, bucket, key):
+        return os.path.join(self.server.root, bucket, key)
+
+    def _meta_path(self, bucket, key):
+        return os.path.join(self.server.root, ".meta", bucket, key + ".json")
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status, code):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{code}</Message>' \
+               f'<Resource>{escape(self.path)}</Resource><RequestId>1</RequestId></Error>'
+        self._reply(status, body.encode(), {"Content-Type": "application/xml"})
+
+    def _delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def _body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        data = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                # trailer, up to an empty line
+                while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                return bytes(data)
+            data += self.rfile.read(size)
+            self.rfile.readline()
+
+    def do_PUT(self):
+        self._delay()
+        bucket, key, _ = self._split()
+        data = self._body()
+        if not key:
+            os.makedirs(self._path(bucket, ""), exist_ok=True)
+            self._reply(200)
+            return
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.rename(path + ".tmp", path)
+        meta = {name.lower(): value for name, value in self.headers.items() if name.lower().startswith(META_PREFIX)}
+        meta["etag"] = md5(data).hexdigest()
+        os.makedirs(os.path.dirname(self._meta_path(bucket, key)), exist_ok=True)
+        with open(self._meta_path(bucket, key), "w") as f:
+            json.dump(meta, f)
+        with self.server.lock:
+            self.server.n_puts += 1
+        self._reply(200, headers={"ETag": f'"{meta["etag"]}"'})
+
+    def _object_headers(self, bucket, key):
+        path = self._path(bucket, key)
+        with open(self._meta_path(bucket, key)) as f:
+            meta = json.load(f)
+        headers = {"ETag": f'"{meta.pop("etag")}"', "Content-Type": "application/octet-stream",
+                   "Last-Modified": formatdate(os.stat(path).st_mtime, usegmt=True)}
+        for name, value in meta.items():
+            # X-Amz-Meta-St_mode, as minio returns it
+            headers["-".join(part.capitalize() for part in name.split("-"))] = value
+        return headers
+
+    def do_HEAD(self):
+        self._delay()
+        bucket, key, _ = self._split()
+        path = self._path(bucket, key)
+        if not key or not os.path.isfile(path):
+            self._error(404, "NoSuchKey")
+            return
+        headers = self._object_headers(bucket, key)
+        headers["Content-Length"] = str(os.stat(path).st_size)
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_GET(self):
+        self._delay()
+        bucket, key, query = self._split()
+        if not key:
+            if "location" in query:
+                body = f'<?xml version="1.0" encoding="UTF-8"?><LocationConstraint xmlns="{S3_NS}"></LocationConstraint>'
+                self._reply(200, body.encode(), {"Content-Type": "application/xml"})
+            else:
+                self._list(bucket, query)
+            return
+        path = self._path(bucket, key)
+        if not os.path.isfile(path):
+            self._error(404, "NoSuchKey")
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        self._reply(200, data, self._object_headers(bucket, key))
+
+    def _list(self, bucket, query):
+        prefix = query.get("prefix", [""])[0]
+        root = self._path(bucket, "")
+        contents = ""
+        for dirpath, _, files in os.walk(root):
+            for name in sorted(files):
+                key = os.path.relpath(os.path.join(dirpath, name), root)
+                if not key.startswith(prefix) or key.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(dirpath, name))
+                modified = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(stat.st_mtime))
+                contents += f"<Contents><Key>{escape(key)}</Key><LastModified>{modified}</LastModified>" \
+                            f"<ETag>&quot;0&quot;</ETag><Size>{stat.st_size}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+        body = f'<?xml version="1.0" encoding="UTF-8"?><ListBucketResult xmlns="{S3_NS}"><Name>{bucket}</Name>' \
+               f'<Prefix>{escape(prefix)}</Prefix><KeyCount>0</KeyCount><MaxKeys>1000</MaxKeys>' \
+               f'<IsTruncated>false</IsTruncated>{contents}</ListBucketResult>'
+        self._reply(200, body.encode(), {"Content-Type": "application/xml"})
+
+    def do_DELETE(self):
+        self._delay()
+        bucket, key, _ = self._split()
+        for path in (self._path(bucket, key), self._meta_path(bucket, key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._reply(204)
+
+
+class S3Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, root, latency=0):
+        super().__init__(address, S3Handler)
+        self.lock = threading.Lock()
+        self.root = root
+        self.latency = latency
+        self.n_puts = 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("port", type=int)
+    parser.add_argument("root")
+    parser.add_argument("--latency", type=float, default=0)
+    args = parser.parse_args()
+    os.makedirs(args.root, exist_ok=True)
+    server = S3Server(("127.0.0.1", args.port), args.root, args.latency)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ import subprocess
 import shutil
 import os
 import json
+import time
+import socket
+import sys
+import sqlite3
 
 
 ROOT = os.getcwd()
@@ -245,7 +249,8 @@ int hellob_gen()
 
         self._rm(["proto/a_proto.pb-c.c"])
         self._compile(umake)
-        is_changed = {"a_use.o": True, "b_notuse.o": False, "proto/a_proto.pb-c.c": True, "proto/a_proto.pb-c.h": True, "proto/a_proto.pb-c.o": True, "test.so": True}
+        # the regenerated sources are identical: a_use.o is up to date, a_proto.pb-c.o lost its input so it is rebuilt, to the same object
+        is_changed = {"a_use.o": False, "b_notuse.o": False, "proto/a_proto.pb-c.c": True, "proto/a_proto.pb-c.h": True, "proto/a_proto.pb-c.o": True, "test.so": False}
         timestamps = self._check_file_exists(["a_use.o", "b_notuse.o", "proto/a_proto.pb-c.c", "proto/a_proto.pb-c.h", "proto/a_proto.pb-c.o", "test.so"], check_timestamp=timestamps, is_changed=is_changed)
         
         umake  = ":foreach proto/*.proto > protoc-c -I={dir} --c_out={dir} {filename} > {dir}/{noext}.pb-c.c {dir}/{noext}.pb-c.h\n"
@@ -488,7 +493,159 @@ int hellob_gen()
         self._create("a.sh", "/bin/cat a && /bin/cat d && /bin/cat b && echo n >> c\n")
         self._compile(umake)
         self._assert_compilation("c", deps_conf=[], deps_manual=[], deps_auto_in=["a", "a.sh", "b", "d"])
-    
+
+    def test_autodep_forking(self):
+        """ files opened by processes running at once, strace splits their calls in unfinished and resumed lines """
+        deps = [f"d{idx}.txt" for idx in range(20)]
+        for dep in deps:
+            self._create(dep, dep)
+        self._create("par.sh", "".join(f"/bin/cat {dep} > /dev/null &\n" for dep in deps) + "wait\necho done > out.txt\n")
+        self._compile(": > ./par.sh > out.txt")
+        self._assert_compilation("out.txt", deps_conf=[], deps_manual=[], deps_auto_in=sorted(deps + ["par.sh"]))
+
+        """ a dep a background process opens is rebuilt for """
+        timestamps = self._check_file_exists(["out.txt"], check_timestamp={"out.txt": 0}, is_changed={"out.txt": True})
+        self._create("d7.txt", "changed")
+        self._compile(": > ./par.sh > out.txt")
+        self._check_file_exists(["out.txt"], check_timestamp=timestamps, is_changed={"out.txt": True})
+
+    def test_dependency_cycle(self):
+        self._create("a.txt", "a\n")
+        with open('env/UMakefile', "w") as umakefile:
+            umakefile.write(": a.txt > cp {filename} {target}.tmp > a.txt\n")
+
+        """ reported with the nodes closing the cycle, without a traceback """
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            check_output("umake --no-remote-cache --no-local-cache", cwd="env/", shell=True, stderr=subprocess.STDOUT)
+        out = raised.exception.output.decode("utf-8")
+        self.assertIn("ERROR dependency cycle", out)
+        self.assertIn(f"depends on '{os.path.join(ROOT, 'env', 'a.txt')}'", out)
+        self.assertNotIn("Traceback", out)
+
+        """ the graph is usable once the cycle is gone """
+        self._compile(": a.txt > cp {filename} {target} > b.txt\n")
+        self._check_file_exists(["b.txt"])
+
+    def test_incremental_edges(self):
+        """ a few deps are added one by one, many are added as a batch """
+        for n_deps in [3, 100]:
+            shutil.rmtree("env", ignore_errors=True)
+            os.mkdir("env")
+            for idx in range(n_deps):
+                self._create(f"d{idx}.txt", f"{idx}\n")
+            self._create("cat.sh", "cat $(cat list.txt) > $1\n")
+            self._create("list.txt", "d0.txt\n")
+            umake = ": cat.sh > ./cat.sh {target} > out.txt\n"
+            self._compile(umake)
+            timestamps = self._check_file_exists(["out.txt"], check_timestamp={"out.txt": 0}, is_changed={"out.txt": True})
+
+            """ deps added """
+            self._create("list.txt", "".join(f"d{idx}.txt\n" for idx in range(n_deps)))
+            self._compile(umake)
+            timestamps = self._check_file_exists(["out.txt"], check_timestamp=timestamps, is_changed={"out.txt": True})
+            self._create(f"d{n_deps - 1}.txt", "changed\n")
+            self._compile(umake)
+            timestamps = self._check_file_exists(["out.txt"], check_timestamp=timestamps, is_changed={"out.txt": True})
+
+            """ deps removed, changing them doesn't build again """
+            self._create("list.txt", "d0.txt\n")
+            self._compile(umake)
+            timestamps = self._check_file_exists(["out.txt"], check_timestamp=timestamps, is_changed={"out.txt": True})
+            self._assert_compilation("out.txt", deps_conf=["cat.sh"], deps_manual=[], deps_auto_in=["d0.txt", "list.txt"])
+            self._create(f"d{n_deps - 1}.txt", "changed again\n")
+            self._compile(umake)
+            self._check_file_exists(["out.txt"], check_timestamp=timestamps, is_changed={"out.txt": False})
+
+    def test_early_cutoff(self):
+        self._create("gen.sh", "echo hello > $1\n")
+        umake = ": gen.sh > ./gen.sh {target} > gen.txt\n"
+        umake += ": gen.txt > cp {filename} {target} > copy.txt\n"
+        umake += ": copy.txt > cp {filename} {target} > final.txt\n"
+        self._compile(umake)
+        timestamps = {"gen.txt": 0, "copy.txt": 0, "final.txt": 0}
+        is_changed = {"gen.txt": True, "copy.txt": True, "final.txt": True}
+        timestamps = self._check_file_exists(["gen.txt", "copy.txt", "final.txt"], check_timestamp=timestamps, is_changed=is_changed)
+
+        """ the generator runs again with the same output, the commands after it are up to date """
+        self._create("gen.sh", "# same output\necho hello > $1\n")
+        self._compile(umake)
+        is_changed = {"gen.txt": True, "copy.txt": False, "final.txt": False}
+        timestamps = self._check_file_exists(["gen.txt", "copy.txt", "final.txt"], check_timestamp=timestamps, is_changed=is_changed)
+
+        """ and stay up to date """
+        self._compile(umake)
+        is_changed = {"gen.txt": False, "copy.txt": False, "final.txt": False}
+        timestamps = self._check_file_exists(["gen.txt", "copy.txt", "final.txt"], check_timestamp=timestamps, is_changed=is_changed)
+
+        """ another output, all rebuilt """
+        self._create("gen.sh", "echo bye > $1\n")
+        self._compile(umake)
+        is_changed = {"gen.txt": True, "copy.txt": True, "final.txt": True}
+        timestamps = self._check_file_exists(["gen.txt", "copy.txt", "final.txt"], check_timestamp=timestamps, is_changed=is_changed)
+        with open("env/final.txt") as f:
+            self.assertEqual(f.read(), "bye\n")
+
+        """ a target changed by hand is rebuilt and the commands after it run again """
+        self._create("copy.txt", "changed\n")
+        self._compile(umake)
+        with open("env/final.txt") as f:
+            self.assertEqual(f.read(), "bye\n")
+        is_changed = {"gen.txt": False, "copy.txt": True, "final.txt": True}
+        timestamps = self._check_file_exists(["gen.txt", "copy.txt", "final.txt"], check_timestamp=timestamps, is_changed=is_changed)
+
+    def test_target_index(self):
+        """ the targets the index matches are the ones pywildcard matches """
+        sys.path.insert(0, os.path.dirname(ROOT))
+        from umake import pywildcard
+        from umake.target_index import TargetIndex
+        targets = ["/r/a.c", "/r/src/x.c", "/r/src/fo/x.c", "/r/src/foo1/x.c", "/r/src/foo2/x.c", "/r/src/foo2/y.c",
+                   "/r/src/foo1/deep/x.c", "/r/src/bar/x.c", "/r/src/foo[1]/x.c", "/r/srcfoo/x.c",
+                   "/r/lib/a.o", "/r/lib/b.o", "/r/lib/sub/c.o"]
+        index = TargetIndex(targets)
+        patterns = ["/r/**/x.c", "/r/src/**", "/r/src/**/x.c", "/r/lib/**.o",
+                    "/r/lib/?.o", "/r/s?c/x.c", "/r/src/fo?/x.c", "/r/src/foo?/x.c",
+                    "/r/lib/[ab].o", "/r/src/[fb]*/x.c", "/r/src/foo[12]/x.c", "/r/src/foo[!1]/x.c",
+                    "/r/src/foo*/x.c", "/r/src*/x.c", "/r/*/x.c", "/r/src/*/*/x.c", "/r/lib/*.o",
+                    "/r/src/foo1/x.c", "/r/nothing/*.c"]
+        for pattern in patterns:
+            expected = {target for target in targets if pywildcard.fnmatch(target, pattern)}
+            self.assertEqual(index.match(pattern), expected, msg=pattern)
+
+    def test_racy_rewrite(self):
+        """ a source rewritten with the same size right after the build that hashed it """
+        self._create("a.txt", "aaaa\n")
+        umake = ": a.txt > cp {filename} {target} > b.txt\n"
+        self._compile(umake)
+        # the digest of a file modified within the last 2 seconds isn't remembered
+        for content in ["bbbb\n", "cccc\n"]:
+            self._create("a.txt", content)
+            self._compile(umake)
+            with open("env/b.txt") as f:
+                self.assertEqual(f.read(), content)
+
+    def test_lazy_imports(self):
+        """ a build with nothing to do doesn't load the modules of uploads, remote workers and watch mode """
+        shared = os.path.join(ROOT, "env", "shared")
+        self._create("a.txt", "a\n")
+        with open('env/UMakefile', "w") as umakefile:
+            umakefile.write(f"[cache:shared:{shared}]\n: a.txt > cp {{filename}} {{target}} > b.txt\n")
+        check_output("umake", cwd="env/", shell=True)
+        modules_file = os.path.join(ROOT, "env", "modules")
+        run_umake = ("import atexit, runpy, sys\n"
+                     "modules_file = sys.argv[1]\n"
+                     "atexit.register(lambda: open(modules_file, 'w').write(' '.join(sys.modules)))\n"
+                     "sys.argv = sys.argv[2:]\n"
+                     "runpy.run_path(sys.argv[0], run_name='__main__')\n")
+        umake_script = os.path.join(os.path.dirname(ROOT), "umake", "umake")
+        for args in [[], ["--show-all-targets"]]:
+            check_output([sys.executable, "-c", run_umake, modules_file, umake_script] + args, cwd="env/",
+                         env=dict(os.environ, PYTHONPATH=os.path.dirname(ROOT)))
+            with open(modules_file) as f:
+                modules = f.read().split()
+            self.assertIn("umake.graph_store", modules)
+            for module in ["umake.uploader", "umake.artifact", "umake.remote_exec", "umake.watch", "minio"]:
+                self.assertNotIn(module, modules, msg=args)
+
     def test_include(self):
         self._create("UMakfile_b", ": > ../helper_file_create.sh something b > b\n")
         umake = "[include:UMakfile_b]\n"
@@ -503,6 +660,378 @@ int hellob_gen()
         self._compile(umake)
         self._check_file_exists(["other_dir/b"])
 
+    def test_umakefile_cache(self):
+        """ the evaluation of the previous run is used only where nothing it depends on changed """
+        self._create("a.c", "")
+        self._create("src/m/x.c", "")
+        self._create("UMakefile_b", ": a.o > cp {filename} {target} > a.copy\n")
+        umake = ":foreach *.c > cp {filename} {target} > {dir}/{noext}.o\n"
+        umake += ":foreach src/*/x.c > cp {filename} {target} > {dir}/x.out\n"
+        umake += "[include:UMakefile_b]\n"
+        self._compile(umake)
+        self._check_file_exists(["a.o", "a.copy", "src/m/x.out"])
+        self._compile(umake)
+        out = check_output("umake --no-remote-cache --no-local-cache", cwd="env/", shell=True).decode("utf-8")
+        self.assertIn("(evaluated 0/3 templates)", out)
+
+        """ new sources in globbed directories """
+        self._create("b.c", "")
+        self._create("src/n/x.c", "")
+        self._compile(umake)
+        self._check_file_exists(["b.o", "src/n/x.out"])
+
+        """ included UMakefile changed """
+        self._create("UMakefile_b", ": b.o > cp {filename} {target} > b.copy\n")
+        self._compile(umake)
+        self._check_file_exists(["b.copy"])
+        self._check_file_not_exists(["a.copy"])
+
+        """ removed source """
+        self._rm(["a.c"])
+        self._compile(umake)
+        self._check_file_not_exists(["a.o"])
+
+    def test_depfile(self):
+        self._create_setup_simple_umake()
+        umake = ":foreach *.c > gcc -g -O2 -Wall -fPIC -MD -MF {depfile} -c {filename} -o {target} > {dir}/{noext}.o\n"
+        self._compile(umake)
+        timestamps = {"a.o": 0, "b.o": 0}
+        is_changed = {"a.o": True, "b.o": True}
+        timestamps = self._check_file_exists(["a.o", "b.o"], check_timestamp=timestamps, is_changed=is_changed)
+        self._assert_compilation("a.o", deps_conf=["a.c"], deps_manual=[], deps_auto_in=["a.h"])
+        self._assert_compilation("b.o", deps_conf=["b.c"], deps_manual=[], deps_auto_in=["b.h"])
+
+        """ header from the depfile is modified, only its object is recompiled """
+        self._create("a.h", "int a();\n")
+        self._compile(umake)
+        is_changed = {"a.o": True, "b.o": False}
+        self._check_file_exists(["a.o", "b.o"], check_timestamp=timestamps, is_changed=is_changed)
+
+    def test_job_limits(self):
+        """ serial.sh fails if another one is running """
+        self._create("serial.sh", "#!/bin/bash\nmkdir running || exit 1\nsleep 0.3\ncp $1 $2\nrmdir running\n")
+        for name in ["a", "b", "c"]:
+            self._create(f"{name}.txt", name)
+        umake = ":foreach *.txt > ./serial.sh {filename} {target} > {dir}/{noext}.out\n"
+
+        """ commands of a pool run one at a time """
+        self._compile("[pool:serial:1]\n" + umake)
+        self._check_file_exists(["a.out", "b.out", "c.out"])
+
+        """ no room next to the running command, by the memory it took last time """
+        for name in ["a", "b", "c"]:
+            self._create(f"{name}.txt", name * 2)
+        check_output("umake --no-remote-cache --no-local-cache -j 3 --memory-limit 1", cwd="env/", shell=True)
+        self._check_file_exists(["a.out", "b.out", "c.out"])
+
+        """ pools are declared with their depth """
+        self._compile("[pool:other]\n" + umake, should_fail=True)
+
+        """ a bad limit in the environment is reported by its name """
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            check_output("UMAKE_MEMORY_LIMIT_MB=2G umake --help", cwd="env/", shell=True, stderr=subprocess.STDOUT)
+        self.assertIn("$UMAKE_MEMORY_LIMIT_MB=2G is invalid", raised.exception.output.decode("utf-8"))
+
+    def test_local_cache(self):
+        self._create("a.sh", "echo hello\n")
+        umake = ": a.sh > install -m 555 {filename} {target} > x.sh\n"
+        umake += ": a.sh > cp {filename} {target} > y.sh\n"
+        with open('env/UMakefile', "w") as umakefile:
+            umakefile.write(umake)
+        check_output("umake --no-remote-cache", cwd="env/", shell=True)
+
+        """ identical targets are stored once """
+        self.assertEqual(len(os.listdir("env/.umake/build-cache/blobs")), 1)
+
+        """ the metadata of the commands is in one db, not a file per command """
+        self.assertEqual([name for name in os.listdir("env/.umake/build-cache") if name.startswith("md-")], [])
+        conn = sqlite3.connect("env/.umake/build-cache/metadata.sqlite")
+        self.assertEqual(conn.execute("SELECT count(*) FROM metadata").fetchone()[0], 2)
+        conn.close()
+
+        """ restored from the cache with their mode """
+        self._rm(["x.sh", "y.sh"])
+        out = check_output("umake --no-remote-cache", cwd="env/", shell=True).decode("utf-8")
+        self.assertIn("LOCAL-CACHE", out)
+        for target, mode in [("x.sh", 0o555), ("y.sh", 0o755)]:
+            with open(f"env/{target}") as f:
+                self.assertEqual(f.read(), "echo hello\n")
+            self.assertEqual(os.stat(f"env/{target}").st_mode & 0o777, mode)
+            self.assertEqual(os.stat(f"env/{target}").st_nlink, 1)
+
+        """ with hardlinks, only the read-only target is linked to its blob, the other keeps its mode """
+        self._rm(["x.sh", "y.sh"])
+        check_output("UMAKE_BUILD_CACHE_HARDLINKS=1 umake --no-remote-cache", cwd="env/", shell=True)
+        self.assertEqual(os.stat("env/x.sh").st_nlink, 2)
+        self.assertEqual(os.stat("env/x.sh").st_mode & 0o777, 0o555)
+        self.assertEqual(os.stat("env/y.sh").st_nlink, 1)
+        self.assertEqual(os.stat("env/y.sh").st_mode & 0o777, 0o755)
+
+        """ rebuilding a linked target with hardlinks turned off doesn't change the cache """
+        self._create("a.sh", "echo bye\n")
+        check_output("umake --no-remote-cache", cwd="env/", shell=True)
+        with open("env/x.sh") as f:
+            self.assertEqual(f.read(), "echo bye\n")
+        self._create("a.sh", "echo hello\n")
+        self._rm(["x.sh"])
+        check_output("umake --no-remote-cache", cwd="env/", shell=True)
+        with open("env/x.sh") as f:
+            self.assertEqual(f.read(), "echo hello\n")
+
+    def test_local_cache_gc(self):
+        for idx in range(5):
+            self._create(f"s{idx}.txt", f"{idx}\n")
+        self._create("gen.sh", "head -c 1000000 /dev/zero > $2\ncat $1 >> $2\n")
+        with open('env/UMakefile', "w") as umakefile:
+            umakefile.write(":foreach *.txt > ./gen.sh {filename} {target} > {noext}.bin\n")
+        check_output("umake --no-remote-cache --local-cache-size 10", cwd="env/", shell=True)
+        self.assertEqual(len(os.listdir("env/.umake/build-cache/blobs")), 5)
+
+        """ least recently used entries are removed down to the low water mark """
+        check_output("umake --no-remote-cache --local-cache-size 4", cwd="env/", shell=True)
+        self.assertEqual(len(os.listdir("env/.umake/build-cache/blobs")), 2)
+        self.assertEqual(len([name for name in os.listdir("env/.umake/build-cache") if name.startswith("ac-")]), 2)
+
+    def test_cache_key(self):
+        self._create("a.txt", "a\n")
+        self._create("b.txt", "b\n")
+        self._create("cat.sh", "cat a.txt b.txt > $1\n")
+        with open('env/UMakefile', "w") as umakefile:
+            umakefile.write(": cat.sh > ./cat.sh {target} > ab.txt\n")
+        check_output("umake --no-remote-cache", cwd="env/", shell=True)
+
+        """ dependencies swapping their contents are a new key """
+        self._create("a.txt", "b\n")
+        self._create("b.txt", "a\n")
+        out = check_output("umake --no-remote-cache", cwd="env/", shell=True).decode("utf-8")
+        self.assertNotIn("LOCAL-CACHE", out)
+        with open("env/ab.txt") as f:
+            self.assertEqual(f.read(), "b\na\n")
+
+        """ and swapping them back is the first key again """
+        self._create("a.txt", "a\n")
+        self._create("b.txt", "b\n")
+        out = check_output("umake --no-remote-cache", cwd="env/", shell=True).decode("utf-8")
+        self.assertIn("LOCAL-CACHE", out)
+        with open("env/ab.txt") as f:
+            self.assertEqual(f.read(), "a\nb\n")
+
+    def test_remote_cache(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        server = subprocess.Popen([sys.executable, "s3_server.py", str(port), "env/s3"])
+        env = dict(os.environ, UMAKE_REMOTE_CACHE_ENDPOINT=f"127.0.0.1:{port}")
+        try:
+            self._create("a.sh", "echo hello\n")
+            self._create("b.txt", "b\n")
+            with open('env/UMakefile', "w") as umakefile:
+                umakefile.write(": a.sh > cp {filename} {target} > x.sh\n: b.txt > cp {filename} {target} > y.txt\n")
+            time.sleep(0.5)
+            out = check_output("umake", cwd="env/", shell=True, env=env).decode("utf-8")
+            self.assertIn("remote uploads: 4 done", out)
+            bucket = "env/s3/umake-build-cache"
+            self.assertEqual(len([name for name in os.listdir(bucket) if name.startswith("md-")]), 2)
+            """ the targets of a command are packed in one object """
+            self.assertEqual(len([name for name in os.listdir(bucket) if name.startswith("ac-")]), 2)
+
+            """ restored from the remote cache """
+            self._rm(["x.sh", "y.txt"])
+            out = check_output("umake --no-local-cache", cwd="env/", shell=True, env=env).decode("utf-8")
+            self.assertEqual(out.count("REMOTE-CACHE"), 2)
+            with open("env/x.sh") as f:
+                self.assertEqual(f.read(), "echo hello\n")
+            self.assertTrue(os.access("env/x.sh", os.X_OK))
+
+            """ prefetched into an empty local cache """
+            self._rm(["x.sh", "y.txt"])
+            shutil.rmtree("env/.umake")
+            out = check_output("umake", cwd="env/", shell=True, env=env).decode("utf-8")
+            self.assertEqual(out.count("REMOTE-CACHE"), 2)
+            self.assertIn("prefetched from remote cache: 2 metadata, 2 targets", out)
+            self.assertTrue(os.access("env/x.sh", os.X_OK))
+        finally:
+            server.terminate()
+            server.wait()
+
+    def test_cache_tiers(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        server = subprocess.Popen([sys.executable, "s3_server.py", str(port), "env/http"])
+        shared = os.path.join(ROOT, "env", "shared")
+        try:
+            self._create("a.sh", "echo hello\n")
+            self._create("b.txt", "b\n")
+            with open('env/UMakefile', "w") as umakefile:
+                umakefile.write(f"[cache:shared:{shared}]\n[cache:http://127.0.0.1:{port}/cache]\n"
+                                ": a.sh > cp {filename} {target} > x.sh\n: b.txt > cp {filename} {target} > y.txt\n")
+            time.sleep(0.5)
+            out = check_output("umake", cwd="env/", shell=True).decode("utf-8")
+            self.assertIn("remote uploads: 8 done", out)
+            self.assertEqual(sorted(name[:3] for name in os.listdir("env/shared")), ["ac-", "ac-", "md-", "md-"])
+            self.assertEqual(sorted(name[:3] for name in os.listdir("env/http/cache")), ["ac-", "ac-", "md-", "md-"])
+
+            """ restored from the http tier, and saved to the shared tier before it """
+            shutil.rmtree("env/shared")
+            self._rm(["x.sh", "y.txt"])
+            shutil.rmtree("env/.umake")
+            out = check_output("umake", cwd="env/", shell=True).decode("utf-8")
+            self.assertEqual(out.count("REMOTE-CACHE"), 2)
+            self.assertEqual(sorted(name[:3] for name in os.listdir("env/shared")), ["ac-", "ac-", "md-", "md-"])
+        finally:
+            server.terminate()
+            server.wait()
+
+        """ the shared tier alone, the http tier is down """
+        self._rm(["x.sh", "y.txt"])
+        out = check_output("umake --no-local-cache", cwd="env/", shell=True).decode("utf-8")
+        self.assertEqual(out.count("REMOTE-CACHE"), 2)
+        self.assertTrue(os.access("env/x.sh", os.X_OK))
+
+    def test_streamed_upload(self):
+        """ a packed result bigger than what is packed ahead is uploaded as it is packed, with no length """
+        sys.path.insert(0, os.path.dirname(ROOT))
+        from umake import artifact
+        from umake.cache_backend import create_backend
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        server = subprocess.Popen([sys.executable, "s3_server.py", str(port), "env/http"])
+        self._create("a.bin", "".join(chr(ord("a") + idx % 26) * (idx % 100) for idx in range(10000)))
+        self._create("b.sh", "echo b\n")
+        entries = [(name, os.path.join("env", name), os.stat(os.path.join("env", name)).st_mode)
+                   for name in ["a.bin", "b.sh"]]
+        try:
+            time.sleep(0.5)
+            for spec in [f"shared:{os.path.join(ROOT, 'env', 'shared')}", f"http://127.0.0.1:{port}/cache"]:
+                backend = create_backend(spec, 1)
+                for fill_size, name in [(1024, "streamed"), (artifact.BUFFER_MAX_SIZE, "buffered")]:
+                    packed = artifact.PackedStream(entries)
+                    length = packed.fill(fill_size)
+                    self.assertEqual(length is None, name == "streamed")
+                    backend.put(name, packed, length)
+                    dests = {target: os.path.join("env", f"{name}-{target}") for target, _, _ in entries}
+                    with backend.get(name) as data:
+                        artifact.unpack(data, dests)
+                    for target, path, st_mode in entries:
+                        with open(path, "rb") as f, open(dests[target], "rb") as g:
+                            self.assertEqual(f.read(), g.read(), msg=f"{spec} {name} {target}")
+                        self.assertEqual(os.stat(dests[target]).st_mode, st_mode)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def test_remote_workers(self):
+        ports = []
+        for _ in range(2):
+            sock = socket.socket()
+            sock.bind(("127.0.0.1", 0))
+            ports.append(sock.getsockname()[1])
+            sock.close()
+        env = dict(os.environ, UMAKE_WORKER_TOKEN="secret")
+        workers = [subprocess.Popen(f"exec umake worker --listen 127.0.0.1:{port} --slots 1 --dir env/.worker{idx}", shell=True, env=env)
+                   for idx, port in enumerate(ports)]
+        remote_workers = ",".join(f"127.0.0.1:{port}" for port in ports)
+
+        """ reachable from other hosts only with a token """
+        with self.assertRaises(subprocess.CalledProcessError):
+            check_output("exec umake worker --listen 0.0.0.0:0 --dir env/.worker", shell=True, stderr=subprocess.STDOUT, timeout=10)
+        try:
+            for port in ports:
+                for _ in range(100):
+                    try:
+                        socket.create_connection(("127.0.0.1", port)).close()
+                        break
+                    except ConnectionRefusedError:
+                        time.sleep(0.1)
+            self._create_setup_simple_umake()
+            with open('env/UMakefile', "w") as umakefile:
+                umakefile.write(":foreach *.c > gcc -g -O2 -Wall -fPIC -c {filename} -o {target} > {dir}/{noext}.o\n"
+                                ": *.o > gcc -g --shared -O2 -Wall -fPIC {filename} -o {target} > test.so\n")
+            umake = f"umake --no-remote-cache --no-local-cache --remote-workers {remote_workers}"
+            check_output(umake, cwd="env/", shell=True, env=env)
+            timestamps = {"a.o": 0, "b.o": 0, "test.so": 0}
+            is_changed = {"a.o": True, "b.o": True, "test.so": True}
+            timestamps = self._check_file_exists(["a.o", "b.o", "test.so"], check_timestamp=timestamps, is_changed=is_changed)
+            """ the headers weren't known, the workers asked for them """
+            self._assert_compilation("a.o", deps_conf=["a.c"], deps_manual=[], deps_auto_in=["a.h"])
+            self._assert_compilation("b.o", deps_conf=["b.c"], deps_manual=[], deps_auto_in=["b.h"])
+
+            """ only the object of the modified header is compiled again """
+            self._create("b.h", "int hello2();\n")
+            check_output(umake, cwd="env/", shell=True, env=env)
+            is_changed = {"a.o": False, "b.o": True, "test.so": True}
+            self._check_file_exists(["a.o", "b.o", "test.so"], check_timestamp=timestamps, is_changed=is_changed)
+
+            """ a build without the token of the workers runs locally """
+            self._create("b.h", "int hello3();\n")
+            out = check_output(umake, cwd="env/", shell=True).decode("utf-8")
+            self.assertEqual(out.count("is not available"), 2)
+            self._check_file_exists(["a.o", "b.o", "test.so"])
+        finally:
+            for worker in workers:
+                worker.terminate()
+                worker.wait()
+
+        """ the workers are gone, the commands run locally """
+        self._create("a.h", "int hello3();\n")
+        out = check_output(umake, cwd="env/", shell=True).decode("utf-8")
+        self.assertIn("is not available", out)
+        self._check_file_exists(["a.o", "b.o", "test.so"])
+
+    def test_watch(self):
+        self._create_setup_simple_umake()
+        with open('env/UMakefile', "w") as umakefile:
+            umakefile.write(":foreach *.c > gcc -g -O2 -Wall -fPIC -c {filename} -o {target} > {dir}/{noext}.o\n")
+        server = subprocess.Popen("exec umake --watch --no-remote-cache --no-local-cache", cwd="env/", shell=True)
+        try:
+            for _ in range(100):
+                if os.path.exists("env/.umake/watch.sock"):
+                    break
+                time.sleep(0.1)
+            check_output("umake --client", cwd="env/", shell=True)
+            timestamps = {"a.o": 0, "b.o": 0}
+            is_changed = {"a.o": True, "b.o": True}
+            timestamps = self._check_file_exists(["a.o", "b.o"], check_timestamp=timestamps, is_changed=is_changed)
+
+            """ only the modified source is recompiled """
+            self._create("b.h", "int hello2();\n")
+            check_output("umake --client", cwd="env/", shell=True)
+            is_changed = {"a.o": False, "b.o": True}
+            timestamps = self._check_file_exists(["a.o", "b.o"], check_timestamp=timestamps, is_changed=is_changed)
+
+            """ new source is picked up """
+            self._create("c.c", "int c() { return 0; }\n")
+            check_output("umake --client", cwd="env/", shell=True)
+            self._check_file_exists(["c.o"])
+
+            """ failed build is reported """
+            self._create("c.c", "int c( { return 0; }\n")
+            with self.assertRaises(subprocess.CalledProcessError):
+                check_output("umake --client", cwd="env/", shell=True)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def test_trace(self):
+        self._create_setup_simple_umake()
+        with open('env/UMakefile', "w") as umakefile:
+            umakefile.write(":foreach *.c > gcc -g -O2 -Wall -fPIC -c {filename} -o {target} > {dir}/{noext}.o\n")
+        check_output("umake --no-remote-cache --no-local-cache --trace trace.json", cwd="env/", shell=True)
+        with open("env/trace.json") as f:
+            events = json.load(f)["traceEvents"]
+        phases = [event["name"] for event in events if event.get("cat") == "phase"]
+        self.assertEqual(phases, ["load_graph", "scan_fs", "parse_cmd_files", "execute_graph", "dump_graph", "cache_gc"])
+        cmds = {event["name"]: event for event in events if event.get("cat") == "cmd"}
+        self.assertEqual(set(cmds), {"a.o", "b.o"})
+        self.assertIn("max_rss_kb", cmds["a.o"]["args"])
+        cmd_phases = {event["name"] for event in events if event.get("cat") == "cmd-phase"}
+        self.assertTrue({"queue wait", "strace run", "strace parse", "dependency hashing"}.issubset(cmd_phases))
+
 
 if __name__ == '__main__':
     unittest.main()
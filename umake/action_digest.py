@@ -0,0 +1,22 @@
+"""Cache keys of commands: one hash of the command and its (path, digest) dependencies sorted by path."""
+from operator import itemgetter
+
+# changes every key when the layout of the hashed buffers changes
+KEY_VERSION = b"umake-action-1\0"
+
+_path = itemgetter(0)
+
+
+def action_digest(hasher, cmd_hash, deps):
+    """ key of the command <cmd_hash> depending on the (path, digest) pairs <deps> """
+    deps = sorted(deps, key=_path)
+    # paths have no NUL and digests have the size of the algorithm, with the length of the paths
+    # the buffers can't be read two ways
+    paths = "\0".join([path for path, _ in deps]).encode("utf-8", "surrogateescape")
+    h = hasher.new()
+    h.update(KEY_VERSION)
+    h.update(cmd_hash)
+    h.update(len(paths).to_bytes(8, "big"))
+    h.update(paths)
+    h.update(b"".join([digest for _, digest in deps]))
+    return h.digest()
@@ -0,0 +1,216 @@
+"""Packed action results for the remote cache: the targets of a command with their modes in one compressed object."""
+import os
+import struct
+import zlib
+from stat import S_IMODE
+
+MAGIC = b"UMA1"
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {CODEC_RAW: "raw", CODEC_ZLIB: "zlib", CODEC_ZSTD: "zstd"}
+
+CHUNK_SIZE = 256 * 1024
+# results up to this size are not compressed
+RAW_MAX_SIZE = 512
+# above this size favor speed over ratio
+FAST_MIN_SIZE = 64 * 1024 * 1024
+
+# packed results up to this size are packed before they are uploaded, bigger ones while they are uploaded
+BUFFER_MAX_SIZE = 32 * 1024 * 1024
+
+ZLIB_LEVEL = 6
+ZLIB_FAST_LEVEL = 1
+ZSTD_LEVEL = 6
+ZSTD_FAST_LEVEL = 1
+
+# name length, st_mode, content size
+RECORD = struct.Struct("<HIQ")
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def choose_codec(total_size):
+    if total_size <= RAW_MAX_SIZE:
+        return CODEC_RAW
+    if zstandard is not None:
+        return CODEC_ZSTD
+    return CODEC_ZLIB
+
+
+class _Raw:
+
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b""
+
+    def decompress(self, data):
+        return data
+
+
+def _compressor(codec, total_size):
+    fast = total_size >= FAST_MIN_SIZE
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_FAST_LEVEL if fast else ZSTD_LEVEL).compressobj()
+    if codec == CODEC_ZLIB:
+        return zlib.compressobj(ZLIB_FAST_LEVEL if fast else ZLIB_LEVEL)
+    return _Raw()
+
+
+def _decompressor(codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ArtifactError("packed with zstd, zstandard module is not installed")
+        return zstandard.ZstdDecompressor().decompressobj()
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj()
+    if codec == CODEC_RAW:
+        return _Raw()
+    raise ArtifactError(f"unknown codec {codec}")
+
+
+def _pack_chunks(entries, sizes, codec):
+    compressor = _compressor(codec, sum(sizes))
+    yield MAGIC + bytes([codec])
+    for (target, path, st_mode), size in zip(entries, sizes):
+        name = target.encode("utf-8")
+        yield compressor.compress(RECORD.pack(len(name), S_IMODE(st_mode), size) + name)
+        left = size
+        with open(path, "rb") as f:
+            while left:
+                chunk = f.read(min(CHUNK_SIZE, left))
+                if not chunk:
+                    raise ArtifactError(f"{path} changed while packed")
+                left -= len(chunk)
+                yield compressor.compress(chunk)
+    yield compressor.flush()
+
+
+def pack(entries, out, codec=None):
+    """ <entries>: [(target, path of its content, st_mode)], writes the packed result to <out>,
+        returns the codec (chosen by size, unless given) """
+    sizes = [os.stat(path).st_size for _, path, _ in entries]
+    if codec is None:
+        codec = choose_codec(sum(sizes))
+    for chunk in _pack_chunks(entries, sizes, codec):
+        out.write(chunk)
+    return codec
+
+
+class PackedStream:
+    """ file object reading the packed result of <entries> (see pack()), packed as it is read """
+
+    def __init__(self, entries):
+        sizes = [os.stat(path).st_size for _, path, _ in entries]
+        self.chunks = _pack_chunks(entries, sizes, choose_codec(sum(sizes)))
+        self.buf = bytearray()
+        self.eof = False
+        # bytes returned by read()
+        self.n_read = 0
+
+    def _fill(self, size):
+        while not self.eof and (size < 0 or len(self.buf) < size):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+            else:
+                self.buf += chunk
+
+    def fill(self, size):
+        """ packs up to <size> bytes ahead of the reads, returns the length of the packed result if that was
+            all of it, None if it is bigger """
+        self._fill(size + 1)
+        if not self.eof:
+            return None
+        return self.n_read + len(self.buf)
+
+    def read(self, size=-1):
+        self._fill(size)
+        if size < 0:
+            size = len(self.buf)
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
+        self.n_read += len(data)
+        return data
+
+
+class _Reader:
+    """ exact reads of the decompressed stream """
+
+    def __init__(self, stream, decompressor):
+        self.stream = stream
+        self.decompressor = decompressor
+        self.buf = bytearray()
+        self.eof = False
+
+    def _fill(self):
+        data = self.stream.read(CHUNK_SIZE)
+        if not data:
+            self.eof = True
+            if hasattr(self.decompressor, "flush"):
+                self.buf += self.decompressor.flush()
+            return
+        self.buf += self.decompressor.decompress(data)
+
+    def read(self, size):
+        """ up to <size> bytes, less only at the end of the stream """
+        while len(self.buf) < size and not self.eof:
+            self._fill()
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
+        return data
+
+    def read_exact(self, size):
+        data = self.read(size)
+        if len(data) != size:
+            raise ArtifactError("truncated")
+        return data
+
+    def at_end(self):
+        while not self.buf and not self.eof:
+            self._fill()
+        return not self.buf
+
+
+def unpack(stream, dests):
+    """ <stream>: readable packed result, <dests>: target -> path to write it to,
+        every target of <dests> has to be in the result. returns target -> st_mode """
+    header = stream.read(len(MAGIC) + 1)
+    if len(header) != len(MAGIC) + 1 or header[:len(MAGIC)] != MAGIC:
+        raise ArtifactError("not a packed result")
+    reader = _Reader(stream, _decompressor(header[len(MAGIC)]))
+    modes = dict()
+    while not reader.at_end():
+        name_len, st_mode, size = RECORD.unpack(reader.read_exact(RECORD.size))
+        target = reader.read_exact(name_len).decode("utf-8")
+        if target not in dests:
+            raise ArtifactError(f"unexpected target {target}")
+        dst = dests[target]
+        try:
+            # might be a hardlink to a local cache blob
+            os.remove(dst)
+        except FileNotFoundError:
+            pass
+        with open(dst, "wb") as f:
+            left = size
+            while left:
+                chunk = reader.read(min(CHUNK_SIZE, left))
+                if not chunk:
+                    raise ArtifactError("truncated")
+                left -= len(chunk)
+                f.write(chunk)
+        os.chmod(dst, st_mode)
+        modes[target] = st_mode
+    missing = set(dests) - set(modes)
+    if missing:
+        raise ArtifactError(f"missing targets {', '.join(sorted(missing))}")
+    return modes
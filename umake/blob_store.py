@@ -0,0 +1,111 @@
+"""Content addressed store of the targets of the local cache, build-cache/blobs/<digest>."""
+import errno
+import fcntl
+import os
+import shutil
+import threading
+from os.path import join
+from stat import S_IMODE
+
+# _IOW(0x94, 9, int), linux/fs.h
+FICLONE = 0x40049409
+COPY_CHUNK = 1024 * 1024
+
+
+def blob_mode(st_mode):
+    """ a blob is read-only, executable if the target is """
+    return 0o555 if st_mode & 0o111 else 0o444
+
+
+class BlobStore:
+
+    def __init__(self, root, hardlinks=False):
+        self.root = root
+        self.hardlinks = hardlinks
+        # turned off by the first filesystem that doesn't support them
+        self.reflink = True
+        self.copy_range = hasattr(os, "copy_file_range")
+
+    def path(self, digest):
+        return join(self.root, digest)
+
+    def _reflink(self, fsrc, fdst):
+        try:
+            fcntl.ioctl(fdst, FICLONE, fsrc)
+            return True
+        except OSError as e:
+            # EXDEV: the target is on another filesystem than the cache, others still might clone
+            if e.errno != errno.EXDEV:
+                self.reflink = False
+            return False
+
+    def _copy_range(self, fsrc, fdst):
+        size = os.fstat(fsrc).st_size
+        copied = 0
+        try:
+            while copied < size:
+                n = os.copy_file_range(fsrc, fdst, size - copied)
+                if n == 0:
+                    break
+                copied += n
+            return True
+        except OSError:
+            self.copy_range = False
+            os.lseek(fsrc, 0, os.SEEK_SET)
+            os.lseek(fdst, 0, os.SEEK_SET)
+            os.ftruncate(fdst, 0)
+            return False
+
+    def _copy(self, src, dst, st_mode):
+        """ copy <src> to the new file <dst>, sharing the data blocks when the filesystem can """
+        with open(src, "rb") as fsrc:
+            fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with open(fd, "wb") as fdst:
+                if not (self.reflink and self._reflink(fsrc.fileno(), fd)) and \
+                   not (self.copy_range and self._copy_range(fsrc.fileno(), fd)):
+                    shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+                os.fchmod(fd, S_IMODE(st_mode))
+
+    def put(self, src, digest):
+        """ store the content of <src>, nothing to do if a blob with the same digest exists """
+        blob = self.path(digest)
+        if os.path.exists(blob):
+            return
+        tmp = f"{blob}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            self._copy(src, tmp, blob_mode(os.stat(src).st_mode))
+            os.rename(tmp, blob)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def restore(self, digest, dst, st_mode):
+        """ write the blob to <dst> as a new file, raises FileNotFoundError if the blob doesn't exist """
+        blob = self.path(digest)
+        blob_st_mode = os.stat(blob).st_mode
+        try:
+            # never write through <dst>, it might be linked to a blob
+            os.remove(dst)
+        except FileNotFoundError:
+            pass
+        # a target the command left writable is copied, even with hardlinks
+        if self.hardlinks and S_IMODE(blob_st_mode) == S_IMODE(st_mode):
+            try:
+                os.link(blob, dst)
+                return
+            except OSError:
+                # another filesystem, too many links, ...
+                pass
+        self._copy(blob, dst, st_mode)
+
+    def detach(self, path):
+        """ unlink <path> if it shares its inode with a blob, so a command rewriting it won't change the blob """
+        # restored while hardlinks were enabled, whatever they are now
+        try:
+            if os.stat(path).st_nlink > 1:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
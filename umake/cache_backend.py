@@ -0,0 +1,243 @@
+"""Storage backends of the shared cache tiers: a shared directory, an HTTP server or a minio bucket."""
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from umake.colored_output import UMAKE_REMOTE_CACHE_ENDPOINT, UMAKE_REMOTE_CACHE_ACCESS_KEY, \
+    UMAKE_REMOTE_CACHE_SECRET_KEY, UMAKE_REMOTE_CACHE_TIMEOUT
+
+CHUNK_SIZE = 256 * 1024
+# parts of a minio upload of unknown length
+MINIO_PART_SIZE = 16 * 1024 * 1024
+# an unreachable server should fail the build's first lookup fast
+CONNECT_TIMEOUT = 1
+MINIO_BUCKET = "umake-build-cache"
+
+
+class BackendError(Exception):
+    """ the backend failed, not a miss. <fatal>: no point trying again """
+
+    def __init__(self, message, fatal=False):
+        super().__init__(message)
+        self.fatal = fatal
+
+
+class CacheBackend:
+
+    def __init__(self, spec):
+        self.spec = spec
+
+    def get(self, name):
+        """ binary file object of object <name>, to be closed. raises FileNotFoundError if there is none """
+        raise NotImplementedError
+
+    def put(self, name, data, length):
+        """ stores <length> bytes read from file object <data> as object <name>, <length> None: read to the end """
+        raise NotImplementedError
+
+    def list(self):
+        """ (name, size) of all objects """
+        raise NotImplementedError(f"{self.spec}: listing is not supported")
+
+    def delete(self, name):
+        raise NotImplementedError(f"{self.spec}: deleting is not supported")
+
+
+class _Response:
+    """ body of an urllib3 response, close() returns the connection to the pool """
+
+    def __init__(self, response, errors):
+        self.response = response
+        self.errors = errors
+
+    def read(self, size=None):
+        try:
+            return self.response.read(size)
+        except self.errors as e:
+            raise BackendError(str(e))
+
+    def close(self):
+        self.response.release_conn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _pool(maxsize, **kwargs):
+    import urllib3
+    return urllib3.PoolManager(timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=UMAKE_REMOTE_CACHE_TIMEOUT),
+                               maxsize=maxsize,
+                               retries=urllib3.Retry(total=3, backoff_factor=0.5,
+                                                     status_forcelist=[500, 502, 503, 504]),
+                               **kwargs)
+
+
+class SharedFsBackend(CacheBackend):
+
+    def __init__(self, spec, root):
+        super().__init__(spec)
+        self.root = root
+        # another host might write the same object at the same time
+        self.tmp_suffix = f".{socket.gethostname()}.{os.getpid()}"
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, name):
+        try:
+            return open(os.path.join(self.root, name), "rb")
+        except FileNotFoundError:
+            raise
+        except OSError as e:
+            raise BackendError(str(e))
+
+    def put(self, name, data, length):
+        path = os.path.join(self.root, name)
+        tmp_path = f"{path}{self.tmp_suffix}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(data, f, CHUNK_SIZE)
+            os.rename(tmp_path, path)
+        except BaseException as e:
+            # reading <data> might fail too, nothing is left of the object
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if isinstance(e, OSError):
+                raise BackendError(str(e))
+            raise
+
+    def list(self):
+        for dir_entry in os.scandir(self.root):
+            if dir_entry.name.endswith(".tmp") or not dir_entry.is_file():
+                continue
+            yield dir_entry.name, dir_entry.stat().st_size
+
+    def delete(self, name):
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+
+class HttpBackend(CacheBackend):
+
+    def __init__(self, spec, url, maxsize):
+        import urllib3
+        super().__init__(spec)
+        self.url = url.rstrip("/")
+        self.http = _pool(maxsize, block=True)
+        self.errors = (urllib3.exceptions.HTTPError, )
+
+    def get(self, name):
+        try:
+            response = self.http.request("GET", f"{self.url}/{name}", preload_content=False)
+        except self.errors as e:
+            raise BackendError(str(e))
+        if response.status == 200:
+            return _Response(response, self.errors)
+        response.release_conn()
+        if response.status == 404:
+            raise FileNotFoundError(name)
+        raise BackendError(f"GET {name}: HTTP {response.status}")
+
+    def put(self, name, data, length):
+        try:
+            if length is None:
+                # sent chunked as it is read, a retry can't read it again
+                response = self.http.urlopen("PUT", f"{self.url}/{name}", body=iter(lambda: data.read(CHUNK_SIZE), b""),
+                                             headers={"Content-Type": "application/octet-stream"}, chunked=True,
+                                             retries=False)
+            else:
+                response = self.http.urlopen("PUT", f"{self.url}/{name}", body=data,
+                                             headers={"Content-Length": str(length),
+                                                      "Content-Type": "application/octet-stream"})
+        except self.errors as e:
+            raise BackendError(str(e))
+        if response.status >= 300:
+            raise BackendError(f"PUT {name}: HTTP {response.status}")
+
+
+class MinioBackend(CacheBackend):
+
+    def __init__(self, spec, endpoint, maxsize):
+        import certifi
+        import urllib3
+        import minio
+        from minio import Minio, error
+        super().__init__(spec)
+        http = _pool(maxsize, block=True, cert_reqs='CERT_REQUIRED', ca_certs=certifi.where())
+        self.mc = Minio(endpoint,
+                        access_key=UMAKE_REMOTE_CACHE_ACCESS_KEY,
+                        secret_key=UMAKE_REMOTE_CACHE_SECRET_KEY,
+                        secure=False,
+                        http_client=http)
+        self.error = error
+        self.errors = (urllib3.exceptions.HTTPError, error.MinioError)
+        # older clients need the length of an object up front
+        self.unknown_length = int(minio.__version__.split(".")[0]) >= 7
+
+    def _error(self, e):
+        if isinstance(e, self.error.RequestTimeTooSkewed):
+            return BackendError("Time on your host not configured currectlly", fatal=True)
+        return BackendError(str(e))
+
+    def get(self, name):
+        try:
+            return _Response(self.mc.get_object(bucket_name=MINIO_BUCKET, object_name=name), self.errors)
+        except (self.error.NoSuchKey, self.error.NoSuchBucket):
+            raise FileNotFoundError(name)
+        except self.errors as e:
+            raise self._error(e)
+
+    def put(self, name, data, length):
+        if length is None and not self.unknown_length:
+            with tempfile.TemporaryFile() as spooled:
+                shutil.copyfileobj(data, spooled, CHUNK_SIZE)
+                length = spooled.tell()
+                spooled.seek(0)
+                self.put(name, spooled, length)
+            return
+        try:
+            if length is None:
+                self.mc.put_object(bucket_name=MINIO_BUCKET, object_name=name, data=data, length=-1,
+                                   part_size=MINIO_PART_SIZE)
+            else:
+                self.mc.put_object(bucket_name=MINIO_BUCKET, object_name=name, data=data, length=length)
+        except self.errors as e:
+            raise self._error(e)
+
+    def list(self):
+        for obj in self.mc.list_objects(bucket_name=MINIO_BUCKET, recursive=True):
+            if not obj.is_dir:
+                yield obj.object_name, obj.size
+
+    def delete(self, name):
+        self.mc.remove_object(bucket_name=MINIO_BUCKET, object_name=name)
+
+
+def parse_spec(spec):
+    """ (backend class, its location) of a tier spec, raises ValueError if it isn't one """
+    if spec.startswith("shared:"):
+        return SharedFsBackend, spec[len("shared:"):]
+    if spec.startswith("/"):
+        return SharedFsBackend, spec
+    if spec.startswith("http://") or spec.startswith("https://"):
+        return HttpBackend, spec
+    if spec == "minio":
+        return MinioBackend, UMAKE_REMOTE_CACHE_ENDPOINT
+    if spec.startswith("minio://"):
+        return MinioBackend, spec[len("minio://"):]
+    raise ValueError(f"unknown cache backend '{spec}', expected shared:<dir>, http://<host>/<prefix> or minio[://<host>]")
+
+
+def create_backend(spec, maxsize):
+    """ <maxsize>: connections kept open, the number of threads using the backend at once """
+    backend_class, location = parse_spec(spec)
+    if backend_class is SharedFsBackend:
+        return SharedFsBackend(spec, location)
+    return backend_class(spec, location, maxsize)
@@ -0,0 +1,303 @@
+"""Size and last access accounting of the local cache entries and blobs, kept in an sqlite db."""
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+from os.path import join
+
+from umake.metadata_store import DB_NAME as METADATA_DB_NAME
+
+INDEX_NAME = "index.sqlite"
+BLOBS_NAME = "blobs"
+
+# gc starts when the cache is above HIGH_WATER of its max size, and removes entries down to LOW_WATER
+HIGH_WATER = 0.9
+LOW_WATER = 0.6
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)",
+    "CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, size INTEGER, atime REAL, blobs TEXT) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER) WITHOUT ROWID",
+]
+
+
+def _path_size(path):
+    """ size of a file, or of all the files under a directory """
+    if not os.path.isdir(path):
+        return os.stat(path).st_size
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.stat(join(root, f)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def _remove(path):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CacheIndex:
+
+    def __init__(self, cache_dir, metadata=None):
+        self.cache_dir = cache_dir
+        # MetadataStore of the md- entries
+        self.metadata = metadata
+        self.blobs_dir = join(cache_dir, BLOBS_NAME)
+        self.lock = threading.RLock()
+        self.loaded = False
+        # the db matches the memory
+        self.synced = False
+        # size written back by the last build, until loaded
+        self.recorded_size = None
+        # name -> [size, atime, digests]
+        self.entries = dict()
+        # digest -> [size, refs]
+        self.blobs = dict()
+        self.total_size = 0
+        self.dirty_entries = set()
+        self.dirty_blobs = set()
+
+    def _connect(self):
+        conn = sqlite3.connect(join(self.cache_dir, INDEX_NAME), isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def _load(self):
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT value FROM meta WHERE key='synced'").fetchone()
+                if row is not None and row[0] == 1:
+                    for name, size, atime, digests in conn.execute("SELECT name, size, atime, blobs FROM entries"):
+                        self.entries[name] = [size, atime, digests.split() if digests else []]
+                    for digest, size in conn.execute("SELECT digest, size FROM blobs"):
+                        self.blobs[digest] = [size, 0]
+                else:
+                    self._scan()
+                    self._write_all(conn)
+                # until written back, the db might not match the cache dir
+                self._set_synced(conn, False)
+            finally:
+                conn.close()
+            for size, _, digests in self.entries.values():
+                self.total_size += size
+                for digest in digests:
+                    if digest in self.blobs:
+                        self.blobs[digest][1] += 1
+            for size, _ in self.blobs.values():
+                self.total_size += size
+            self.loaded = True
+
+    def _scan(self):
+        """ index the cache dir as it is """
+        for dir_entry in os.scandir(self.cache_dir):
+            name = dir_entry.name
+            if name == BLOBS_NAME or name.startswith(INDEX_NAME) or name.startswith(METADATA_DB_NAME) or \
+                    name.endswith(".lock") or name.endswith(".tmp"):
+                continue
+            try:
+                stat = dir_entry.stat()
+                digests = []
+                if name.startswith("ac-"):
+                    with open(dir_entry.path, "rb") as entry_file:
+                        digests = [digest for digest, _ in pickle.load(entry_file).values()]
+                self.entries[name] = [_path_size(dir_entry.path), stat.st_atime, digests]
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                continue
+        if self.metadata is not None:
+            for cache_hash, size, saved in self.metadata.entries():
+                self.entries["md-" + cache_hash.hex()] = [size or 0, saved, []]
+        if os.path.isdir(self.blobs_dir):
+            for dir_entry in os.scandir(self.blobs_dir):
+                if dir_entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    self.blobs[dir_entry.name] = [dir_entry.stat().st_size, 0]
+                except FileNotFoundError:
+                    continue
+
+    def _write_all(self, conn):
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM entries")
+        conn.execute("DELETE FROM blobs")
+        conn.executemany("INSERT INTO entries (name, size, atime, blobs) VALUES (?, ?, ?, ?)",
+                         ((name, size, atime, " ".join(digests)) for name, (size, atime, digests) in self.entries.items()))
+        conn.executemany("INSERT INTO blobs (digest, size) VALUES (?, ?)",
+                         ((digest, size) for digest, (size, _) in self.blobs.items()))
+        conn.execute("COMMIT")
+
+    def _set_synced(self, conn, synced):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced', ?)", (int(synced),))
+        self.synced = synced
+
+    def _changed(self):
+        """ the db doesn't match the cache dir until the next flush """
+        if not self.synced:
+            return
+        conn = self._connect()
+        try:
+            self._set_synced(conn, False)
+        finally:
+            conn.close()
+
+    def _recorded_size(self):
+        """ total size written back by the last flush, None if the db doesn't match the cache dir """
+        if self.recorded_size is None:
+            conn = self._connect()
+            try:
+                meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('synced', 'total_size')"))
+            finally:
+                conn.close()
+            if meta.get("synced") == 1 and "total_size" in meta:
+                self.recorded_size = meta["total_size"]
+        return self.recorded_size
+
+    def size(self):
+        """ bytes used by the cache """
+        if not self.loaded:
+            recorded = self._recorded_size()
+            if recorded is not None:
+                return recorded
+        self._load()
+        return self.total_size
+
+    def _drop_entry(self, name):
+        old = self.entries.pop(name, None)
+        if old is None:
+            return
+        size, _, digests = old
+        self._changed()
+        self.total_size -= size
+        for digest in digests:
+            if digest in self.blobs:
+                self.blobs[digest][1] -= 1
+        self.dirty_entries.add(name)
+
+    def add(self, name, size, digests=()):
+        """ entry <name> was written, replacing the entry of the same name """
+        self._load()
+        with self.lock:
+            self._drop_entry(name)
+            self._changed()
+            self.entries[name] = [size, time.time(), list(digests)]
+            self.total_size += size
+            for digest in digests:
+                if digest in self.blobs:
+                    self.blobs[digest][1] += 1
+            self.dirty_entries.add(name)
+
+    def add_blob(self, digest, size):
+        self._load()
+        with self.lock:
+            if digest in self.blobs:
+                return
+            self._changed()
+            self.blobs[digest] = [size, 0]
+            self.total_size += size
+            self.dirty_blobs.add(digest)
+
+    def touch(self, name):
+        """ entry <name> was used """
+        self._load()
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None:
+                self._changed()
+                entry[1] = time.time()
+                self.dirty_entries.add(name)
+
+    def remove(self, name):
+        """ entry <name> was removed from the cache dir """
+        self._load()
+        with self.lock:
+            self._drop_entry(name)
+
+    def _remove_blob(self, digest):
+        self._changed()
+        size, _ = self.blobs.pop(digest)
+        _remove(join(self.blobs_dir, digest))
+        self.total_size -= size
+        self.dirty_blobs.add(digest)
+        return size
+
+    def evict(self, max_size, keep=frozenset()):
+        """ remove the least recently used entries if the cache is too big, returns the number of bytes freed.
+            blobs of <keep> (digests) stay, they are removed by a later evict """
+        if not self.loaded:
+            recorded = self._recorded_size()
+            if recorded is not None and recorded <= max_size * HIGH_WATER:
+                # not used by this build and not too big
+                return 0
+        self._load()
+        with self.lock:
+            if self.total_size <= max_size * HIGH_WATER:
+                return 0
+            low_water = max_size * LOW_WATER
+            freed = 0
+            metadata_hashes = []
+            for digest in [digest for digest, (_, refs) in self.blobs.items() if refs <= 0 and digest not in keep]:
+                freed += self._remove_blob(digest)
+            for name in sorted(self.entries, key=lambda name: self.entries[name][1]):
+                if self.total_size <= low_water:
+                    break
+                size, _, digests = self.entries[name]
+                if name.startswith("md-") and self.metadata is not None:
+                    metadata_hashes.append(bytes.fromhex(name[3:]))
+                # md- files of the cache dir are from before the metadata store
+                _remove(join(self.cache_dir, name))
+                self._drop_entry(name)
+                freed += size
+                for digest in digests:
+                    if digest in self.blobs and self.blobs[digest][1] <= 0 and digest not in keep:
+                        freed += self._remove_blob(digest)
+            if metadata_hashes:
+                self.metadata.remove(metadata_hashes)
+            return freed
+
+    def flush(self):
+        """ write back what changed since the last flush """
+        if not self.loaded:
+            return
+        with self.lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN")
+                for name in self.dirty_entries:
+                    entry = self.entries.get(name)
+                    if entry is None:
+                        conn.execute("DELETE FROM entries WHERE name=?", (name,))
+                    else:
+                        size, atime, digests = entry
+                        conn.execute("INSERT OR REPLACE INTO entries (name, size, atime, blobs) VALUES (?, ?, ?, ?)",
+                                     (name, size, atime, " ".join(digests)))
+                for digest in self.dirty_blobs:
+                    blob = self.blobs.get(digest)
+                    if blob is None:
+                        conn.execute("DELETE FROM blobs WHERE digest=?", (digest,))
+                    else:
+                        conn.execute("INSERT OR REPLACE INTO blobs (digest, size) VALUES (?, ?)", (digest, blob[0]))
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('total_size', ?)", (self.total_size,))
+                self._set_synced(conn, True)
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            self.dirty_entries.clear()
+            self.dirty_blobs.clear()
@@ -2,29 +2,64 @@ import sys
 import threading
 import os
 from os.path import join
-from subprocess import check_output, CalledProcessError
 from datetime import datetime
 
+
+def _env(name, default, parse):
+    """ $<name> (or <default>) parsed by <parse>, exits naming the variable if it can't be parsed """
+    value = os.environ.get(name, default)
+    try:
+        return parse(value)
+    except ValueError as e:
+        sys.exit(f"umake: ${name}={value} is invalid: {e}")
+
+
+def _jobs(value):
+    from umake.scheduler import parse_jobs
+    parse_jobs(value)
+    return value
+
+
 ROOT = os.getcwd()
 UMAKE_ROOT_DIR = join(ROOT, ".umake")
 UMKAE_TMP_DIR = join(UMAKE_ROOT_DIR, "tmp")
 UMAKE_BUILD_CACHE_DIR = join(UMAKE_ROOT_DIR, "build-cache")
-UMAKE_BUILD_CACHE_MAX_SIZE_MB = 1500
+UMAKE_BUILD_CACHE_BLOBS_DIR = join(UMAKE_BUILD_CACHE_DIR, "blobs")
+UMAKE_BUILD_CACHE_MAX_SIZE_MB = _env("UMAKE_BUILD_CACHE_MAX_SIZE_MB", "1500", int)
+# restore read-only targets as hardlinks to the cache blobs
+UMAKE_BUILD_CACHE_HARDLINKS = os.environ.get("UMAKE_BUILD_CACHE_HARDLINKS", "0") == "1"
 MINIMAL_ENV = {"PATH": "/usr/bin"}
-UMAKE_MAX_WORKERS = 8
-UMAKE_DB = join(UMAKE_ROOT_DIR, "db.pickle")
+# commands running at once: a number, or "auto" for the number of cpus less the load of the host
+UMAKE_JOBS = _env("UMAKE_JOBS", "auto", _jobs)
+# memory the running commands may use, by their peak memory the last time they ran, 0 for no limit
+UMAKE_MEMORY_LIMIT_MB = _env("UMAKE_MEMORY_LIMIT_MB", "0", int)
+# `umake worker` host:port to run the commands on (comma separated), instead of locally
+UMAKE_REMOTE_WORKERS = [address.strip() for address in os.environ.get("UMAKE_REMOTE_WORKERS", "").split(",") if address.strip()]
+# sent to the workers, the one they were started with
+UMAKE_WORKER_TOKEN = os.environ.get("UMAKE_WORKER_TOKEN") or None
+UMAKE_DB = join(UMAKE_ROOT_DIR, "db.sqlite")
+UMAKE_REMOTE_CACHE_ENDPOINT = os.environ.get("UMAKE_REMOTE_CACHE_ENDPOINT", "my-server")
+UMAKE_REMOTE_CACHE_ACCESS_KEY = os.environ.get("UMAKE_REMOTE_CACHE_ACCESS_KEY", "user")
+UMAKE_REMOTE_CACHE_SECRET_KEY = os.environ.get("UMAKE_REMOTE_CACHE_SECRET_KEY", "pass")
+# read timeout of the remote cache requests in seconds
+UMAKE_REMOTE_CACHE_TIMEOUT = _env("UMAKE_REMOTE_CACHE_TIMEOUT", "10", float)
+# shared cache tiers after the local cache, nearest first (comma separated), overrides [cache:...] of the UMakefile
+UMAKE_CACHE_TIERS = [spec.strip() for spec in os.environ.get("UMAKE_CACHE_TIERS", "").split(",") if spec.strip()]
+UMAKE_REMOTE_UPLOAD_WORKERS = 4
+# uploads waiting before commands are blocked
+UMAKE_REMOTE_UPLOAD_QUEUE = 64
+# concurrent downloads of the remote cache prefetch
+UMAKE_REMOTE_PREFETCH_WORKERS = 16
+# seconds to wait for the uploads at the end of the build
+UMAKE_REMOTE_UPLOAD_TIMEOUT = _env("UMAKE_REMOTE_UPLOAD_TIMEOUT", "60", int)
+UMAKE_HASH_ALGO = os.environ.get("UMAKE_HASH_ALGO", "sha1")
+# relative to ROOT, unix socket paths are limited to 108 chars
+UMAKE_WATCH_SOCKET = join(".umake", "watch.sock")
 
 
 file_action_fmt = "   [{action}] {filename}"
 is_ineractive_terminal = sys.stdout.isatty()
 
-def get_size_KB(path):
-    try:
-        return int(check_output(['du','-s', path]).split()[0].decode('utf-8'))
-    except CalledProcessError:
-        return 0
-
-
 class bcolors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -57,22 +92,36 @@ class InteractiveOutput:
     def __init__(self):
         self.bar_lock = threading.Lock()
         self.n_active_workers = AtomicInt()
+        self.max_workers = 0
         self.n_local_hits = 0
         self.n_remote_hits = 0
         self.n_works_done = 0
         self.cache_current = "N/A"
+        self.cache_max_size_mb = UMAKE_BUILD_CACHE_MAX_SIZE_MB
+        # CacheIndex, for the size of the local cache
+        self.cache_index = None
+        # Uploader of the remote cache, for its queue depth and rate
+        self.uploader = None
         self.start_time = datetime.now()
         self.curr_job = ""
+        # HashCache, for its hits/misses
+        self.hash_cache = None
 
         self.variant = "deafult"
         self.n_calls = 0
 
-    def _get_curr_cache_size(self):
-        if self.n_calls % 10:
-            return self.cache_current
+    def reset(self):
+        """ new build of the same process """
+        self.n_local_hits = 0
+        self.n_remote_hits = 0
+        self.n_works_done = 0
+        self.start_time = datetime.now()
+        self.curr_job = ""
+        self.n_calls = 0
 
-        curr_size_mb = get_size_KB(UMAKE_BUILD_CACHE_DIR) / 1024
-        self.cache_current = curr_size_mb
+    def _get_curr_cache_size(self):
+        if self.cache_index is not None:
+            self.cache_current = int(self.cache_index.size() / 1024 / 1024)
 
     def update_bar(self, force=False):
         with self.bar_lock:
@@ -84,8 +133,8 @@ class InteractiveOutput:
             diff = int((datetime.now() - self.start_time).total_seconds())
             
             sys.stdout.write("\x1b[2K\r")
-            print(f"\r{bright_blue} Workers  {bcolors.ENDC}{bold}{self.n_active_workers}/{UMAKE_MAX_WORKERS}{bcolors.ENDC}", end="")
-            print(f"{bright_blue} Cache  {bcolors.ENDC}{bold}{int(self.cache_current)}/{UMAKE_BUILD_CACHE_MAX_SIZE_MB}[MB] {bcolors.ENDC}", end="")
+            print(f"\r{bright_blue} Workers  {bcolors.ENDC}{bold}{self.n_active_workers}/{self.max_workers}{bcolors.ENDC}", end="")
+            print(f"{bright_blue} Cache  {bcolors.ENDC}{bold}{self.cache_current}/{self.cache_max_size_mb}[MB] {bcolors.ENDC}", end="")
             if self.n_works_done:
                 n_cache_hits = self.n_local_hits + self.n_remote_hits
                 cache_ratio = int(n_cache_hits / self.n_works_done * 100)
@@ -96,6 +145,10 @@ class InteractiveOutput:
                     remote_ratio = int(self.n_remote_hits / n_cache_hits * 100)
                 print(f"{bright_blue} Cache Hits  {bcolors.ENDC}{bold}{cache_ratio}% {bcolors.ENDC}", end="")
                 print(f"{bright_blue} Local/Remote  {bcolors.ENDC}{bold}{local_ratio}%/{remote_ratio}%  {bcolors.ENDC}", end="")
+            if self.hash_cache is not None and (self.hash_cache.hits or self.hash_cache.misses):
+                print(f"{bright_blue} Hash Cache Hit/Miss  {bcolors.ENDC}{bold}{self.hash_cache.hits}/{self.hash_cache.misses} {bcolors.ENDC}", end="")
+            if self.uploader is not None and self.uploader.started:
+                print(f"{bright_blue} Uploads  {bcolors.ENDC}{bold}{self.uploader.pending()} queued {self.uploader.rate() / 1024 / 1024:.1f}MB/s {bcolors.ENDC}", end="")
             print(f"{bright_blue} Variant {bcolors.ENDC}{bold} {self.variant} {bcolors.ENDC}", end="")
             print(f"{bright_blue} Time  {bcolors.ENDC}{bold} {diff}[sec] {bcolors.ENDC}", end="")
             print(f"{bold} {self.curr_job} {bcolors.ENDC}", end="")
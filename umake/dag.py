@@ -0,0 +1,236 @@
+"""Directed acyclic graph of named nodes, with a topological rank kept up to date on edge insertion."""
+from collections import deque
+
+_NO_EDGES = frozenset()
+
+
+class CycleError(ValueError):
+
+    def __init__(self, message, edge=None):
+        super().__init__(message)
+        # (from, to) of the edge closing the cycle, if it is known
+        self.edge = edge
+
+
+class Dag:
+
+    def __init__(self):
+        self.ids = dict()
+        self.names = list()
+        self.succs = list()
+        self.preds = list()
+        self.rank = list()
+        self.free_ids = list()
+        self.next_rank = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def add_node(self, name):
+        if name in self.ids:
+            return self.ids[name]
+        if self.free_ids:
+            node_id = self.free_ids.pop()
+            self.names[node_id] = name
+            self.succs[node_id] = _NO_EDGES
+            self.preds[node_id] = _NO_EDGES
+            self.rank[node_id] = self.next_rank
+        else:
+            node_id = len(self.names)
+            self.names.append(name)
+            self.succs.append(_NO_EDGES)
+            self.preds.append(_NO_EDGES)
+            self.rank.append(self.next_rank)
+        self.next_rank += 1
+        self.ids[name] = node_id
+        return node_id
+
+    def add_nodes(self, names):
+        for name in names:
+            self.add_node(name)
+
+    def remove_nodes(self, names):
+        """ returns the edges that were removed with the nodes """
+        removed_edges = list()
+        for name in names:
+            node_id = self.ids.pop(name)
+            for succ in self.succs[node_id]:
+                self.preds[succ].discard(node_id)
+                removed_edges.append((name, self.names[succ]))
+            for pred in self.preds[node_id]:
+                self.succs[pred].discard(node_id)
+                removed_edges.append((self.names[pred], name))
+            self.names[node_id] = None
+            self.succs[node_id] = _NO_EDGES
+            self.preds[node_id] = _NO_EDGES
+            self.free_ids.append(node_id)
+        return removed_edges
+
+    def has_edge(self, from_name, to_name):
+        try:
+            return self.ids[to_name] in self.succs[self.ids[from_name]]
+        except KeyError:
+            return False
+
+    def _link(self, from_id, to_id):
+        if self.succs[from_id] is _NO_EDGES:
+            self.succs[from_id] = set()
+        if self.preds[to_id] is _NO_EDGES:
+            self.preds[to_id] = set()
+        self.succs[from_id].add(to_id)
+        self.preds[to_id].add(from_id)
+
+    def add_edge(self, from_name, to_name):
+        """ returns False if the edge already exists """
+        from_id = self.ids[from_name]
+        to_id = self.ids[to_name]
+        if to_id in self.succs[from_id]:
+            return False
+        self._reorder_for(from_id, to_id)
+        self._link(from_id, to_id)
+        return True
+
+    def add_edges(self, edges):
+        """ returns the edges that didn't exist before """
+        ids = self.ids
+        added = [(from_name, to_name) for from_name, to_name in edges if not self.has_edge(from_name, to_name)]
+        if len(added) < max(64, len(ids) // 8):
+            self._add_one_by_one(added)
+        else:
+            for from_name, to_name in added:
+                self._link(ids[from_name], ids[to_name])
+            try:
+                self._rerank()
+            except CycleError:
+                self.remove_edges(added)
+                self._rerank()
+                # raises again, with the edge closing the cycle
+                self._add_one_by_one(added)
+                raise
+        return added
+
+    def _add_one_by_one(self, edges):
+        """ none of <edges> is added if one of them closes a cycle """
+        ids = self.ids
+        linked = []
+        try:
+            for from_name, to_name in edges:
+                from_id = ids[from_name]
+                to_id = ids[to_name]
+                # the same edge might appear twice in the batch
+                if to_id not in self.succs[from_id]:
+                    self._reorder_for(from_id, to_id)
+                    self._link(from_id, to_id)
+                    linked.append((from_name, to_name))
+        except CycleError:
+            # the order is still valid without them
+            self.remove_edges(linked)
+            raise
+
+    def remove_edges(self, edges):
+        for from_name, to_name in edges:
+            try:
+                from_id = self.ids[from_name]
+                to_id = self.ids[to_name]
+            except KeyError:
+                continue
+            if to_id in self.succs[from_id]:
+                self.succs[from_id].discard(to_id)
+                self.preds[to_id].discard(from_id)
+
+    def degree(self, name):
+        node_id = self.ids[name]
+        return len(self.succs[node_id]) + len(self.preds[node_id])
+
+    def successors(self, name):
+        names = self.names
+        return [names[succ] for succ in self.succs[self.ids[name]]]
+
+    def predecessors(self, name):
+        names = self.names
+        return [names[pred] for pred in self.preds[self.ids[name]]]
+
+    def ancestors(self, name):
+        """ <name> and all the nodes it is reachable from """
+        start = self.ids[name]
+        seen = {start}
+        queue = [start]
+        preds = self.preds
+        while queue:
+            for pred in preds[queue.pop()]:
+                if pred not in seen:
+                    seen.add(pred)
+                    queue.append(pred)
+        return seen
+
+    def topological_sort(self, ids=None):
+        """ names of all nodes (or of <ids>) in topological order """
+        if ids is None:
+            ids = self.ids.values()
+        names = self.names
+        return [names[node_id] for node_id in sorted(ids, key=self.rank.__getitem__)]
+
+    def _cycle_error(self, from_id, to_id):
+        return CycleError(f"adding edge '{self.names[from_id]}' -> '{self.names[to_id]}' creates a cycle",
+                          (self.names[from_id], self.names[to_id]))
+
+    def _reorder_for(self, from_id, to_id):
+        """ Pearce-Kelly: fix the ranks before adding the edge from_id -> to_id """
+        rank = self.rank
+        lower = rank[to_id]
+        upper = rank[from_id]
+        if upper < lower:
+            return
+        if from_id == to_id:
+            raise self._cycle_error(from_id, to_id)
+
+        forward = [to_id]
+        seen = {to_id}
+        idx = 0
+        while idx < len(forward):
+            for succ in self.succs[forward[idx]]:
+                if succ == from_id:
+                    raise self._cycle_error(from_id, to_id)
+                if succ not in seen and rank[succ] < upper:
+                    seen.add(succ)
+                    forward.append(succ)
+            idx += 1
+
+        backward = [from_id]
+        seen = {from_id}
+        idx = 0
+        while idx < len(backward):
+            for pred in self.preds[backward[idx]]:
+                if pred not in seen and rank[pred] > lower:
+                    seen.add(pred)
+                    backward.append(pred)
+            idx += 1
+
+        backward.sort(key=rank.__getitem__)
+        forward.sort(key=rank.__getitem__)
+        moved = backward + forward
+        for node_id, new_rank in zip(moved, sorted(rank[node_id] for node_id in moved)):
+            rank[node_id] = new_rank
+
+    def _rerank(self):
+        """ rank all nodes from scratch (Kahn), keeping the previous order where possible """
+        rank = self.rank
+        live = sorted(self.ids.values(), key=rank.__getitem__)
+        in_degree = {node_id: len(self.preds[node_id]) for node_id in live}
+        ready = deque(node_id for node_id in live if in_degree[node_id] == 0)
+        next_rank = 0
+        while ready:
+            node_id = ready.popleft()
+            rank[node_id] = next_rank
+            next_rank += 1
+            for succ in self.succs[node_id]:
+                in_degree[succ] -= 1
+                if in_degree[succ] == 0:
+                    ready.append(succ)
+        if next_rank != len(live):
+            cycle = [self.names[node_id] for node_id, degree in in_degree.items() if degree > 0]
+            raise CycleError(f"graph has a cycle between {cycle[:10]}")
+        self.next_rank = next_rank
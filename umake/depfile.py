@@ -0,0 +1,45 @@
+"""Make-style dependency files, as written by gcc/clang -MD -MF <file>."""
+from os.path import join
+
+
+def _split_words(text):
+    """ whitespace separated words, '\\ ' is an escaped space and '$$' an escaped '$' """
+    word = []
+    idx = 0
+    while idx < len(text):
+        ch = text[idx]
+        if ch == "\\" and idx + 1 < len(text) and text[idx + 1] in " #":
+            word.append(text[idx + 1])
+            idx += 2
+            continue
+        if ch == "$" and text[idx + 1:idx + 2] == "$":
+            word.append("$")
+            idx += 2
+            continue
+        if ch.isspace():
+            if word:
+                yield "".join(word)
+                word = []
+        else:
+            word.append(ch)
+        idx += 1
+    if word:
+        yield "".join(word)
+
+
+def parse(path, cwd):
+    """ prerequisites of all the rules in the depfile at <path>, relative paths are joined to <cwd> """
+    with open(path) as f:
+        content = f.read()
+    # line continuations
+    content = content.replace("\\\r\n", " ").replace("\\\n", " ")
+
+    deps = []
+    for line in content.splitlines():
+        # '<targets>: <prerequisites>', phony rules of -MP ('<header>:') have no prerequisites
+        _, sep, prerequisites = line.partition(": ")
+        if not sep:
+            continue
+        for dep in _split_words(prerequisites):
+            deps.append(dep if dep.startswith("/") else join(cwd, dep))
+    return deps
@@ -0,0 +1,215 @@
+"""Filesystem inputs of a UMakefile evaluation: the UMakefiles and the directories its globs list."""
+import fnmatch
+import glob
+import hashlib
+import os
+import time
+
+# mtimes newer than this when read aren't trusted, filesystem timestamps are coarse
+RACY_NS = 2 * 10 ** 9
+
+
+def file_digest(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).digest()
+    except OSError:
+        return None
+
+
+class FilesDigests:
+
+    def __init__(self, paths):
+        self.digests = {path: file_digest(path) for path in paths}
+
+    def paths(self):
+        return set(self.digests)
+
+    def changed(self):
+        return any(file_digest(path) != digest for path, digest in self.digests.items())
+
+
+def _is_hidden(name):
+    return name[0] == "."
+
+
+def _dir_key(path):
+    """ 'a/' (from 'a/**') and 'a' are the same directory """
+    return path.rstrip(os.sep) or path[:1]
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path or os.curdir).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _trusted_mtime(mtime_ns, now_ns):
+    if mtime_ns is not None and mtime_ns > now_ns - RACY_NS:
+        return -1
+    return mtime_ns
+
+
+def _scan(path):
+    """ [(name, is_dir)] of the entries of <path>, None if it can't be listed """
+    try:
+        with os.scandir(path or os.curdir) as it:
+            entries = []
+            for entry in it:
+                try:
+                    entries.append((entry.name, entry.is_dir()))
+                except OSError:
+                    pass
+            return entries
+    except OSError:
+        return None
+
+
+def _entries_digest(entries, hidden):
+    if entries is None:
+        return None
+    entries = sorted(entry for entry in entries if hidden or not _is_hidden(entry[0]))
+    return hashlib.sha1(repr(entries).encode("utf-8")).digest()
+
+
+class DirListing:
+    """ glob.iglob(<pattern>, recursive=True) of many patterns, listing every directory once """
+
+    def __init__(self):
+        # path -> (mtime_ns before it was listed, entries)
+        self.listings = dict()
+        # path -> names of its entries, for literal lookups
+        self.name_sets = dict()
+
+    def entries(self, path):
+        path = _dir_key(path)
+        try:
+            return self.listings[path][1]
+        except KeyError:
+            mtime_ns = _mtime_ns(path)
+            entries = _scan(path)
+            self.listings[path] = (mtime_ns, entries)
+            return entries
+
+    def mtime_ns(self, path):
+        self.entries(path)
+        return self.listings[_dir_key(path)][0]
+
+    def _names(self, dirname, dironly, dirs, hidden):
+        if dirs is not None:
+            dirs.add(self, dirname, hidden)
+        return [name for name, is_dir in self.entries(dirname) or [] if not dironly or is_dir]
+
+    def _exists(self, dirname, basename, dirs):
+        if basename in (os.curdir, os.pardir):
+            return os.path.lexists(os.path.join(dirname, basename))
+        if dirs is not None:
+            dirs.add(self, dirname, _is_hidden(basename))
+        try:
+            names = self.name_sets[dirname]
+        except KeyError:
+            names = self.name_sets[dirname] = {name for name, _ in self.entries(dirname) or []}
+        return basename in names
+
+    def _glob0(self, dirname, basename, dironly, dirs):
+        if basename:
+            if self._exists(dirname, basename, dirs):
+                return [basename]
+        elif os.path.isdir(dirname):
+            # 'q*x/' matches only directories
+            return [basename]
+        return []
+
+    def _glob1(self, dirname, pattern, dironly, dirs):
+        names = self._names(dirname, dironly, dirs, _is_hidden(pattern))
+        if not _is_hidden(pattern):
+            names = [name for name in names if not _is_hidden(name)]
+        return fnmatch.filter(names, pattern)
+
+    def _rlistdir(self, dirname, dironly, dirs):
+        for name in self._names(dirname, dironly, dirs, False):
+            if not _is_hidden(name):
+                yield name
+                path = os.path.join(dirname, name) if dirname else name
+                for sub_name in self._rlistdir(path, dironly, dirs):
+                    yield os.path.join(name, sub_name)
+
+    def _glob2(self, dirname, pattern, dironly, dirs):
+        yield pattern[:0]
+        yield from self._rlistdir(dirname, dironly, dirs)
+
+    def iglob(self, pathname, dirs=None, dironly=False):
+        """ <dirs>: GlobDirs to add the directories deciding the result to """
+        dirname, basename = os.path.split(pathname)
+        if not glob.has_magic(pathname):
+            if basename:
+                if self._exists(dirname, basename, dirs):
+                    yield pathname
+            elif os.path.isdir(dirname):
+                yield pathname
+            return
+        if not dirname:
+            if basename == "**":
+                yield from self._glob2(dirname, basename, dironly, dirs)
+            else:
+                yield from self._glob1(dirname, basename, dironly, dirs)
+            return
+        if dirname != pathname and glob.has_magic(dirname):
+            dir_names = self.iglob(dirname, dirs, True)
+        else:
+            dir_names = [dirname]
+        if basename == "**":
+            glob_in_dir = self._glob2
+        elif glob.has_magic(basename):
+            glob_in_dir = self._glob1
+        else:
+            glob_in_dir = self._glob0
+        for dirname in dir_names:
+            for name in glob_in_dir(dirname, basename, dironly, dirs):
+                yield os.path.join(dirname, name)
+
+
+class GlobDirs:
+    """ directories whose entries decided the results of globs """
+
+    def __init__(self):
+        # path -> [hidden, mtime_ns, digest], <hidden>: a name starting with "." was looked up in it
+        self.dirs = dict()
+
+    def add(self, listing: DirListing, path, hidden):
+        path = _dir_key(path)
+        entry = self.dirs.get(path)
+        if entry is not None and (entry[0] or not hidden):
+            return
+        entries = listing.entries(path)
+        if entries is None:
+            # only its nearest existing parent changes when it is created
+            parent = os.path.dirname(path)
+            if parent != path:
+                self.add(listing, parent, _is_hidden(os.path.basename(path) or "."))
+        self.dirs[path] = [hidden, _trusted_mtime(listing.mtime_ns(path), int(time.time() * 10 ** 9)),
+                           _entries_digest(entries, hidden)]
+
+    def changed(self, checked):
+        """
+        <checked>: (path, hidden) -> (changed, mtime_ns), of the directories checked already by this run
+        returns (changed, refreshed), <refreshed>: an mtime changed but the entries didn't, worth saving
+        """
+        refreshed = False
+        now_ns = int(time.time() * 10 ** 9)
+        for path, entry in self.dirs.items():
+            key = (path, entry[0])
+            if key in checked:
+                is_changed, mtime_ns = checked[key]
+            else:
+                mtime_ns = _mtime_ns(path)
+                is_changed = mtime_ns != entry[1] and _entries_digest(_scan(path), entry[0]) != entry[2]
+                checked[key] = (is_changed, mtime_ns)
+            if is_changed:
+                return True, refreshed
+            mtime_ns = _trusted_mtime(mtime_ns, now_ns)
+            if mtime_ns != entry[1]:
+                entry[1] = mtime_ns
+                refreshed = True
+        return False, refreshed
@@ -0,0 +1,66 @@
+"""Filesystem scan: stat per directory and hash stale files on a thread pool."""
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+SCAN_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 2)
+
+
+def join_dir(dirname, basename):
+    if dirname == "/":
+        return "/" + basename
+    return dirname + "/" + basename
+
+
+def _stat_dir(dirname, basenames):
+    stats = dict()
+    for basename in basenames:
+        full_path = join_dir(dirname, basename)
+        try:
+            stats[full_path] = os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            stats[full_path] = None
+    return stats
+
+
+def stat_files(paths, executor):
+    """
+    stat all <paths>, the files of a directory are stated by one pool thread
+    returns dict of path -> os.stat_result, or None if the file does not exists
+    """
+    by_dir = defaultdict(set)
+    for path in paths:
+        dirname, basename = os.path.split(path)
+        by_dir[dirname].add(basename)
+
+    stats = dict()
+    for dir_stats in executor.map(lambda item: _stat_dir(*item), by_dir.items()):
+        stats.update(dir_stats)
+    return stats
+
+
+def hash_files(stats, hash_func, executor):
+    """
+    hash all files of <stats> (path -> os.stat_result) in parallel, hash_func(path, stat)
+    returns dict of path -> digest, or None if the file was deleted meanwhile
+    """
+    def _hash(item):
+        path, stat = item
+        try:
+            return path, hash_func(path, stat)
+        except FileNotFoundError:
+            return path, None
+
+    return dict(executor.map(_hash, stats.items()))
+
+
+def scan(paths, is_stale, hash_func, max_workers=SCAN_MAX_WORKERS):
+    """
+    stat all <paths> and hash the ones that <is_stale(path, stat)>
+    returns (stats, hashes) as returned by stat_files() and hash_files()
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        stats = stat_files(paths, executor)
+        stale = {path: stat for path, stat in stats.items() if stat is not None and is_stale(path, stat)}
+        hashes = hash_files(stale, hash_func, executor)
+    return stats, hashes
@@ -0,0 +1,140 @@
+"""On-disk build graph: nodes, edges and file digests in sqlite, only what changed in a run is written back."""
+import sqlite3
+import threading
+
+# a db of an older version is upgraded with MIGRATIONS, one it can't upgrade is recreated empty
+SCHEMA_VERSION = 4
+
+FILE_HASHES_TABLE = ("CREATE TABLE file_hashes (path TEXT PRIMARY KEY, ino INTEGER, size INTEGER, "
+                     "mtime_ns INTEGER, ctime_ns INTEGER, digest BLOB) WITHOUT ROWID")
+
+SCHEMA = [
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value)",
+    "CREATE TABLE nodes (name TEXT PRIMARY KEY, type INTEGER, mtime INTEGER, md5sum BLOB, "
+    "is_modified INTEGER, cmd TEXT, data BLOB, duration REAL, max_rss_kb INTEGER)",
+    "CREATE TABLE edges (src TEXT, dst TEXT, PRIMARY KEY (src, dst)) WITHOUT ROWID",
+    FILE_HASHES_TABLE,
+]
+
+# version -> list of statements upgrading a db from <version> to <version + 1>
+MIGRATIONS = {
+    1: ["ALTER TABLE nodes ADD COLUMN duration REAL"],
+    2: [FILE_HASHES_TABLE],
+    3: ["ALTER TABLE nodes ADD COLUMN max_rss_kb INTEGER"],
+}
+
+
+class GraphStore:
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.reset_reason = None
+        self._check_schema()
+
+    def _get_version(self):
+        try:
+            row = self.conn.execute("SELECT value FROM meta WHERE key='schema_version'").fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def _create(self):
+        with self.transaction():
+            for table in ("meta", "nodes", "edges", "file_hashes"):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('schema_version', ?)", (SCHEMA_VERSION,))
+
+    def _check_schema(self):
+        version = self._get_version()
+        if version is None:
+            self._create()
+            return
+        if version > SCHEMA_VERSION:
+            self.reset_reason = f"db schema {version} is newer than {SCHEMA_VERSION}"
+            self._create()
+            return
+        if version == SCHEMA_VERSION:
+            return
+        if any(v not in MIGRATIONS for v in range(version, SCHEMA_VERSION)):
+            self.reset_reason = f"no migration from db schema {version} to {SCHEMA_VERSION}"
+            self._create()
+            return
+        with self.transaction():
+            for v in range(version, SCHEMA_VERSION):
+                for statement in MIGRATIONS[v]:
+                    self.conn.execute(statement)
+            self.conn.execute("UPDATE meta SET value=? WHERE key='schema_version'", (SCHEMA_VERSION,))
+
+    def transaction(self):
+        return _Transaction(self.conn)
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def load_nodes(self):
+        """ (name, type, mtime, md5sum, is_modified, duration, max_rss_kb, cmd) of all nodes, without their data """
+        with self.lock:
+            return self.conn.execute("SELECT name, type, mtime, md5sum, is_modified, duration, max_rss_kb, cmd "
+                                     "FROM nodes").fetchall()
+
+    def load_edges(self):
+        with self.lock:
+            return self.conn.execute("SELECT src, dst FROM edges").fetchall()
+
+    def load_data(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM nodes WHERE name=?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def load_file_hashes(self):
+        """ (path, ino, size, mtime_ns, ctime_ns, digest) rows """
+        with self.lock:
+            return self.conn.execute("SELECT path, ino, size, mtime_ns, ctime_ns, digest FROM file_hashes").fetchall()
+
+    def clear_file_hashes(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM file_hashes")
+
+    def write(self, new_nodes, updated_nodes, deleted_nodes, new_edges, deleted_edges, meta, file_hashes=()):
+        """
+        new_nodes: (name, type, mtime, md5sum, is_modified, duration, max_rss_kb, cmd, data) rows, replacing existing ones
+        updated_nodes: (mtime, md5sum, is_modified, duration, max_rss_kb, name) rows of nodes whose data didn't change
+        file_hashes: (path, ino, size, mtime_ns, ctime_ns, digest) rows, replacing existing ones
+        """
+        with self.lock, self.transaction():
+            self.conn.executemany("DELETE FROM nodes WHERE name=?", ((name,) for name in deleted_nodes))
+            self.conn.executemany("DELETE FROM file_hashes WHERE path=?", ((name,) for name in deleted_nodes))
+            self.conn.executemany("INSERT OR REPLACE INTO file_hashes (path, ino, size, mtime_ns, ctime_ns, digest) "
+                                  "VALUES (?, ?, ?, ?, ?, ?)", file_hashes)
+            self.conn.executemany("INSERT OR REPLACE INTO nodes (name, type, mtime, md5sum, is_modified, duration, max_rss_kb, "
+                                  "cmd, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", new_nodes)
+            self.conn.executemany("UPDATE nodes SET mtime=?, md5sum=?, is_modified=?, duration=?, max_rss_kb=? WHERE name=?",
+                                  updated_nodes)
+            self.conn.executemany("DELETE FROM edges WHERE src=? AND dst=?", deleted_edges)
+            self.conn.executemany("INSERT OR IGNORE INTO edges (src, dst) VALUES (?, ?)", new_edges)
+            self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta.items())
+
+    def close(self):
+        self.conn.close()
+
+
+class _Transaction:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN")
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
@@ -0,0 +1,134 @@
+"""Content hashing of files, and a cache of their digests by stat signature."""
+import hashlib
+import mmap
+import os
+import threading
+import time
+
+CHUNK_SIZE = 256 * 1024
+# from this size on, hash through mmap and save the copy into a user buffer
+MMAP_MIN_SIZE = 4 * 1024 * 1024
+
+ALGORITHMS = {
+    "sha1": hashlib.sha1,
+    "md5": hashlib.md5,
+    "blake2b": lambda: hashlib.blake2b(digest_size=20),
+    "blake2s": lambda: hashlib.blake2s(digest_size=20),
+}
+
+try:
+    import xxhash
+    if hasattr(xxhash, "xxh3_128"):
+        ALGORITHMS["xxh3"] = xxhash.xxh3_128
+    ALGORITHMS["xxh64"] = xxhash.xxh64
+except ImportError:
+    pass
+
+
+_local = threading.local()
+
+
+def _chunk_buffer():
+    buf = getattr(_local, "buf", None)
+    if buf is None:
+        buf = _local.buf = bytearray(CHUNK_SIZE)
+    return buf
+
+
+class Hasher:
+
+    def __init__(self, algo="sha1"):
+        try:
+            self.new = ALGORITHMS[algo]
+        except KeyError:
+            raise ValueError(f"unknown hash algorithm '{algo}', available: {', '.join(sorted(ALGORITHMS))}")
+        self.algo = algo
+
+    def hash_bytes(self, data):
+        h = self.new()
+        h.update(data)
+        return h.digest()
+
+    def hash_file(self, full_path):
+        h = self.new()
+        with open(full_path, "rb", buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_MIN_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    h.update(mapped)
+                return h.digest()
+
+            buf = _chunk_buffer()
+            view = memoryview(buf)
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(view[:n])
+        return h.digest()
+
+
+def stat_signature(stat):
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns
+
+
+# a file modified within this window might be modified again without its
+# mtime changing (coarse timestamps), its digest is not remembered
+RACY_WINDOW_NS = 2 * 10**9
+
+
+class HashCache:
+    """
+    digests of files keyed by their stat signature (inode, size, mtime, ctime),
+    shared by all threads, and persisted across builds by the caller
+    """
+
+    def __init__(self, hasher: Hasher):
+        self.hasher = hasher
+        self.lock = threading.Lock()
+        self.entries = dict()  # path -> (signature, digest)
+        self.updated = dict()  # entries changed since loaded
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, rows):
+        """ rows of (path, ino, size, mtime_ns, ctime_ns, digest) """
+        with self.lock:
+            for path, ino, size, mtime_ns, ctime_ns, digest in rows:
+                self.entries[path] = ((ino, size, mtime_ns, ctime_ns), digest)
+
+    def take_updated(self):
+        """ rows of entries changed since the last call """
+        with self.lock:
+            updated = self.updated
+            self.updated = dict()
+        return [(path, ) + signature + (digest, ) for path, (signature, digest) in updated.items()]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.updated.clear()
+
+    def discard(self, path):
+        with self.lock:
+            self.entries.pop(path, None)
+            self.updated.pop(path, None)
+
+    def hash_file(self, full_path, stat=None):
+        if stat is None:
+            stat = os.stat(full_path)
+        signature = stat_signature(stat)
+        entry = self.entries.get(full_path)
+        if entry is not None and entry[0] == signature:
+            with self.lock:
+                self.hits += 1
+            return entry[1]
+
+        digest = self.hasher.hash_file(full_path)
+        is_racy = time.time() * 1e9 - max(stat.st_mtime_ns, stat.st_ctime_ns) < RACY_WINDOW_NS
+        with self.lock:
+            self.misses += 1
+            if not is_racy:
+                self.entries[full_path] = (signature, digest)
+                self.updated[full_path] = (signature, digest)
+        return digest
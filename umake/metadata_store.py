@@ -0,0 +1,120 @@
+"""Metadata of the local cache (the dependencies of commands by metadata hash) in one sqlite db."""
+import sqlite3
+import threading
+import time
+from os.path import join
+
+DB_NAME = "metadata.sqlite"
+
+# seconds a write waits for another process writing
+BUSY_TIMEOUT = 30
+
+# hashes per query, below the host parameters limit of old sqlite versions (999)
+BATCH_SIZE = 500
+
+# saved metadata written in one transaction
+FLUSH_EVERY = 256
+
+MMAP_SIZE = 1024 * 1024 * 1024
+
+SCHEMA = [
+    # rows of a few KB, a rowid table keeps them out of the key b-tree
+    "CREATE TABLE IF NOT EXISTS metadata (hash BLOB PRIMARY KEY, deps BLOB, saved REAL)",
+]
+
+
+def _encode(deps):
+    # paths have no NUL
+    return "\0".join(deps).encode("utf-8", "surrogateescape")
+
+
+def _decode(data):
+    if not data:
+        return set()
+    return set(data.decode("utf-8", "surrogateescape").split("\0"))
+
+
+class MetadataStore:
+
+    def __init__(self, cache_dir):
+        self.path = join(cache_dir, DB_NAME)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # hash -> encoded deps, saved but not written yet
+        self.pending = dict()
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=BUSY_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self.local.conn = conn
+        return conn
+
+    def get(self, cache_hash):
+        """ the dependencies saved for <cache_hash>, None if there are none """
+        data = self.pending.get(cache_hash)
+        if data is not None:
+            return _decode(data)
+        row = self._connect().execute("SELECT deps FROM metadata WHERE hash=?", (cache_hash,)).fetchone()
+        if row is None:
+            return None
+        return _decode(row[0])
+
+    def get_many(self, cache_hashes):
+        """ hash -> dependencies, of the <cache_hashes> that have metadata """
+        conn = self._connect()
+        found = dict()
+        with self.lock:
+            for cache_hash in cache_hashes:
+                if cache_hash in self.pending:
+                    found[cache_hash] = _decode(self.pending[cache_hash])
+        cache_hashes = [cache_hash for cache_hash in cache_hashes if cache_hash not in found]
+        for start in range(0, len(cache_hashes), BATCH_SIZE):
+            batch = cache_hashes[start:start + BATCH_SIZE]
+            query = f"SELECT hash, deps FROM metadata WHERE hash IN ({','.join('?' * len(batch))})"
+            for cache_hash, data in conn.execute(query, batch):
+                found[cache_hash] = _decode(data)
+        return found
+
+    def put(self, cache_hash, deps):
+        """ returns the size of the saved metadata """
+        data = _encode(deps)
+        with self.lock:
+            self.pending[cache_hash] = data
+            if len(self.pending) >= FLUSH_EVERY:
+                self._flush()
+        return len(data)
+
+    def _flush(self):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR REPLACE INTO metadata (hash, deps, saved) VALUES (?, ?, ?)",
+                         ((cache_hash, data, now) for cache_hash, data in self.pending.items()))
+        conn.execute("COMMIT")
+        self.pending.clear()
+
+    def flush(self):
+        """ write the saved metadata """
+        with self.lock:
+            if self.pending:
+                self._flush()
+
+    def remove(self, cache_hashes):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            for cache_hash in cache_hashes:
+                self.pending.pop(cache_hash, None)
+                conn.execute("DELETE FROM metadata WHERE hash=?", (cache_hash,))
+            conn.execute("COMMIT")
+
+    def entries(self):
+        """ (hash, size, saved time) of all the metadata """
+        self.flush()
+        return self._connect().execute("SELECT hash, length(deps), saved FROM metadata").fetchall()
@@ -10,17 +10,24 @@ The function translate(PATTERN) returns a regular expression
 corresponding to PATTERN.  (It does not compile it.)
 """
 
+import functools
 import re
 
-__all__ = ["filter", "fnmatch", "fnmatchcase", "translate"]
+__all__ = ["filter", "fnmatch", "fnmatchcase", "translate", "compile_pattern"]
 
-_cache = {}
-_MAXCACHE = 100
+# the least recently used patterns are dropped, one at a time
+_MAXCACHE = 32768
 
 
 def _purge():
     """Clear the pattern cache."""
-    _cache.clear()
+    compile_pattern.cache_clear()
+
+
+@functools.lru_cache(maxsize=_MAXCACHE)
+def compile_pattern(pat):
+    """Compiled regular expression of PATTERN, cached."""
+    return re.compile(translate(pat))
 
 
 def fnmatch(name, pat):
@@ -51,14 +58,7 @@ def filter(names, pat):
     import posixpath
     result = []
     pat = os.path.normcase(pat)
-    try:
-        re_pat = _cache[pat]
-    except KeyError:
-        res = translate(pat)
-        if len(_cache) >= _MAXCACHE:
-            _cache.clear()
-        _cache[pat] = re_pat = re.compile(res)
-    match = re_pat.match
+    match = compile_pattern(pat).match
     if os.path is posixpath:
         # normcase on posix is NOP. Optimize it away from the loop.
         for name in names:
@@ -77,14 +77,7 @@ def fnmatchcase(name, pat):
     This is a version of fnmatch() which doesn't case-normalize
     its arguments.
     """
-    try:
-        re_pat = _cache[pat]
-    except KeyError:
-        res = translate(pat)
-        if len(_cache) >= _MAXCACHE:
-            _cache.clear()
-        _cache[pat] = re_pat = re.compile(res)
-    return re_pat.match(name) is not None
+    return compile_pattern(pat).match(name) is not None
 
 
 def translate(pat):
@@ -0,0 +1,430 @@
+"""Remote execution: the commands of a build run by `umake worker` processes."""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import re
+import shutil
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+from os.path import join
+from subprocess import PIPE, Popen
+
+from umake.blob_store import BlobStore, blob_mode
+from umake.hashing import Hasher
+from umake.scheduler import cpu_count
+from umake.strace import StraceParser
+from umake.trace import communicate
+
+# a message is a 4 bytes length and a json header, a header with "size" is followed by that many bytes of content:
+# scheduler -> worker  {"op": "hello", "algo", "token"}, worker -> scheduler  {"op": "hello", "slots"}
+# scheduler -> worker  {"op": "dirs", "dirs"}, the directories of the project, when they changed
+# scheduler -> worker  {"op": "run", "root", "cmd", "cmd_root", "env", "targets", "depfile", "inputs"}
+# worker -> scheduler  {"op": "want", "digests"}, answered by a {"op": "blob", "digest", "size"} of each
+# worker -> scheduler  {"op": "need", "paths"} it failed to open, answered by {"op": "inputs", "inputs"}
+# worker -> scheduler  {"op": "done", "rc", "stdout", "stderr", "accessed", "max_rss_kb", "n_outputs"},
+#                      then {"op": "output", "path", "mode", "size"} of each file written
+HEADER = struct.Struct("!I")
+CHUNK_SIZE = 256 * 1024
+DEFAULT_PORT = 7600
+# a command runs at most this many times with the files it failed to open
+MAX_ROUNDS = 8
+CONNECT_TIMEOUT = 5
+DEFAULT_LISTEN = f"127.0.0.1:{DEFAULT_PORT}"
+# shared secret of the workers and the schedulers
+TOKEN_ENV = "UMAKE_WORKER_TOKEN"
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class WorkerLost(Exception):
+    """ the worker can't be used anymore, the command can run locally """
+    pass
+
+
+def parse_address(address, default_host="127.0.0.1"):
+    """ (host, port) of host:port, :port or port """
+    host, _, port = address.rpartition(":")
+    return host or default_host, int(port)
+
+
+def _rebase(path, root, new_root):
+    """ <path> moved from under <root> to under <new_root>, None if it isn't under <root> """
+    # <root>/../x is out of <root>
+    path = os.path.normpath(path)
+    if not os.path.isabs(path) or ".." in path.split("/"):
+        return None
+    if path == root:
+        return new_root
+    if path.startswith(root + "/"):
+        return new_root + path[len(root):]
+    return None
+
+
+def _rebase_text(text, root, new_root):
+    """ every path under <root> in <text> moved to under <new_root> """
+    return re.sub(re.escape(root) + r"(?![\w.+-])", lambda _: new_root, text)
+
+
+class Connection:
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+
+    def send(self, header):
+        data = json.dumps(header).encode("utf-8")
+        self.sock.sendall(HEADER.pack(len(data)) + data)
+
+    def send_file(self, header, path):
+        with open(path, "rb") as f:
+            size = header["size"] = os.fstat(f.fileno()).st_size
+            self.send(header)
+            if size:
+                self.sock.sendfile(f, 0, size)
+
+    def _read(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("connection closed")
+        return data
+
+    def recv(self, op=None):
+        size, = HEADER.unpack(self._read(HEADER.size))
+        header = json.loads(self._read(size).decode("utf-8"))
+        if op is not None and header.get("op") != op:
+            raise ProtocolError(f"expected {op}, got {header.get('op')}: {header.get('message', '')}")
+        return header
+
+    def recv_file(self, size, f, digest=None):
+        """ writes the <size> bytes following the last header to file object <f>, updating hash object <digest> """
+        while size:
+            chunk = self.rfile.read(min(size, CHUNK_SIZE))
+            if not chunk:
+                raise ConnectionError("connection closed")
+            f.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            size -= len(chunk)
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class Worker:
+
+    def __init__(self, work_dir, slots, token=None):
+        # inputs by digest, linked into the directories of the actions
+        self.store = BlobStore(join(work_dir, "blobs"), hardlinks=True)
+        self.exec_dir = join(work_dir, "exec")
+        os.makedirs(self.store.root, exist_ok=True)
+        os.makedirs(self.exec_dir, exist_ok=True)
+        self.slots = slots
+        self.running = threading.Semaphore(slots)
+        self.token = token
+
+    def serve(self, conn: Connection):
+        hello = conn.recv("hello")
+        if self.token is not None and not hmac.compare_digest(str(hello.get("token", "")).encode("utf-8"),
+                                                              self.token.encode("utf-8")):
+            conn.send({"op": "error", "message": f"wrong or missing ${TOKEN_ENV}"})
+            raise ProtocolError("wrong or missing token")
+        try:
+            hasher = Hasher(hello["algo"])
+        except ValueError as e:
+            conn.send({"op": "error", "message": str(e)})
+            return
+        conn.send({"op": "hello", "slots": self.slots})
+        dirs = []
+        while True:
+            try:
+                request = conn.recv()
+            except ConnectionError:
+                return
+            if request.get("op") == "dirs":
+                dirs = request["dirs"]
+            elif request.get("op") == "run":
+                self._run(conn, hasher, request, dirs)
+            else:
+                raise ProtocolError(f"unexpected {request.get('op')}")
+
+    def _receive_blob(self, conn, hasher, digest, size):
+        blob = self.store.path(digest)
+        tmp = f"{blob}.{threading.get_ident()}.tmp"
+        content_hash = hasher.new()
+        try:
+            with open(tmp, "wb") as f:
+                conn.recv_file(size, f, content_hash)
+            if content_hash.hexdigest() != digest:
+                raise ProtocolError(f"content sent as {digest} has another digest")
+            os.chmod(tmp, 0o444)
+            os.rename(tmp, blob)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _fetch(self, conn, hasher, inputs):
+        """ asks for the contents of <inputs> (digest, mode) missing from the store """
+        wanted = sorted({digest for digest, _ in inputs if not os.path.exists(self.store.path(digest))})
+        conn.send({"op": "want", "digests": wanted})
+        for _ in wanted:
+            header = conn.recv("blob")
+            self._receive_blob(conn, hasher, header["digest"], header["size"])
+
+    def _run(self, conn, hasher, request, dirs):
+        # path -> (digest, mode)
+        inputs = {path: (digest, mode) for path, digest, mode in request["inputs"]}
+        self._fetch(conn, hasher, inputs.values())
+        # asked for and not found by the scheduler
+        absent = set()
+        with self.running:
+            for round_idx in range(MAX_ROUNDS):
+                exec_root = os.path.realpath(tempfile.mkdtemp(dir=self.exec_dir))
+                try:
+                    result, failed = self._execute(request, inputs, dirs, exec_root)
+                    needed = sorted(failed - set(inputs) - absent)
+                    if needed and round_idx < MAX_ROUNDS - 1:
+                        conn.send({"op": "need", "paths": needed})
+                        found = {path: (digest, mode) for path, digest, mode in conn.recv("inputs")["inputs"]}
+                        absent.update(path for path in needed if path not in found)
+                        if found:
+                            self._fetch(conn, hasher, found.values())
+                            inputs.update(found)
+                            continue
+                    self._reply(conn, request, result, exec_root)
+                    return
+                finally:
+                    shutil.rmtree(exec_root, ignore_errors=True)
+                    try:
+                        os.remove(exec_root + ".strace")
+                    except FileNotFoundError:
+                        pass
+
+    def _execute(self, request, inputs, dirs, exec_root):
+        """ runs the command in <exec_root>, returns (result, paths of the project it failed to open) """
+        root = os.path.normpath(request["root"])
+        for path in dirs:
+            path = _rebase(path, root, exec_root)
+            if path is not None:
+                os.makedirs(path, exist_ok=True)
+        for path, (digest, mode) in inputs.items():
+            dst = _rebase(path, root, exec_root)
+            if dst is None:
+                continue
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            # linked to the store, read-only
+            self.store.restore(digest, dst, blob_mode(mode))
+        cwd = _rebase(request["cmd_root"], root, exec_root) or exec_root
+        os.makedirs(cwd, exist_ok=True)
+        outputs = set(request["targets"])
+        if request["depfile"]:
+            outputs.add(request["depfile"])
+        for path in outputs:
+            dst = _rebase(path, root, exec_root)
+            if dst is not None:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+        cmd = _rebase_text(request["cmd"], root, exec_root)
+        trace_path = exec_root + ".strace"
+        # traced with a depfile too, for the files it failed to open
+        run_cmd = f"strace -o{trace_path} -f -e open,openat /bin/bash -c '{cmd}'"
+        proc = Popen(run_cmd, env=request["env"], shell=True, stdout=PIPE, stderr=PIPE, cwd=cwd)
+        stdout, stderr, rusage = communicate(proc)
+
+        # path as the scheduler knows it -> opened for write
+        accessed = dict()
+        failed = set()
+        parser = StraceParser(keep_failed=True)
+        with open(trace_path, errors="surrogateescape") as strace_output:
+            for line in strace_output:
+                opened = parser.feed(line)
+                if opened is None:
+                    continue
+                path, is_write = opened
+                path = os.path.normpath(join(cwd, path))
+                path = _rebase(path, exec_root, root) or path
+                accessed[path] = accessed.get(path, False) or is_write
+        for path in parser.failed:
+            path = _rebase(os.path.normpath(join(cwd, path)), exec_root, root)
+            if path is not None:
+                failed.add(path)
+        if request["depfile"]:
+            # the dependencies are the depfile's
+            accessed = dict()
+        outputs.update(path for path, is_write in accessed.items() if is_write)
+        outputs = sorted(path for path in outputs
+                         if _rebase(path, root, exec_root) is not None and os.path.isfile(_rebase(path, root, exec_root)))
+        result = {
+            "op": "done",
+            "rc": proc.returncode,
+            "stdout": stdout.decode("utf-8", errors="replace"),
+            "stderr": stderr.decode("utf-8", errors="replace"),
+            "accessed": list(accessed.items()),
+            "max_rss_kb": rusage.ru_maxrss,
+            "n_outputs": len(outputs),
+            "outputs": outputs,
+        }
+        return result, failed
+
+    def _reply(self, conn, request, result, exec_root):
+        root = os.path.normpath(request["root"])
+        outputs = result.pop("outputs")
+        conn.send(result)
+        for path in outputs:
+            exec_path = _rebase(path, root, exec_root)
+            if path == request["depfile"]:
+                with open(exec_path) as f:
+                    content = f.read()
+                with open(exec_path, "w") as f:
+                    f.write(_rebase_text(content, exec_root, root))
+            conn.send_file({"op": "output", "path": path, "mode": os.stat(exec_path).st_mode & 0o7777}, exec_path)
+
+
+def _is_loopback(host):
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback
+                   for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP))
+    except (OSError, ValueError):
+        return False
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def worker_main(argv):
+    parser = argparse.ArgumentParser(prog="umake worker", description="runs the commands of builds given --remote-workers")
+    parser.add_argument("--listen", default=DEFAULT_LISTEN,
+                        help=f"host:port to listen on, port 0 for any, a non-loopback host requires ${TOKEN_ENV} "
+                             f"(default: {DEFAULT_LISTEN})")
+    parser.add_argument("--slots", type=int, default=cpu_count(),
+                        help="commands running at once (default: the number of cpus)")
+    parser.add_argument("--dir", default=join(tempfile.gettempdir(), "umake-worker"),
+                        help="store of the inputs and directories of the commands")
+    args = parser.parse_args(argv)
+    address = parse_address(args.listen)
+    token = os.environ.get(TOKEN_ENV) or None
+    if token is None and not _is_loopback(address[0]):
+        parser.error(f"--listen {args.listen} is reachable from other hosts, set ${TOKEN_ENV}")
+    worker = Worker(args.dir, args.slots, token)
+
+    class Handler(socketserver.BaseRequestHandler):
+
+        def handle(self):
+            conn = Connection(self.request)
+            try:
+                worker.serve(conn)
+            except (OSError, ProtocolError, ValueError) as e:
+                print(f"{self.client_address[0]}:{self.client_address[1]}: {e}", file=sys.stderr, flush=True)
+            finally:
+                conn.close()
+
+    with _Server(address, Handler) as server:
+        host, port = server.server_address[:2]
+        print(f"umake worker listening on {host}:{port}, {args.slots} slots", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+class RemoteWorker:
+    """ a connection to a `umake worker`, running one command at a time """
+
+    def __init__(self, address, algo, token=None):
+        self.address = address
+        sock = socket.create_connection(parse_address(address), timeout=CONNECT_TIMEOUT)
+        # a command might run for long
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.conn = Connection(sock)
+        hello = {"op": "hello", "algo": algo}
+        if token is not None:
+            hello["token"] = token
+        self.conn.send(hello)
+        self.slots = self.conn.recv("hello")["slots"]
+        self.lost = False
+        # directories of the project the worker has
+        self.dirs = None
+
+    @classmethod
+    def connect(cls, address, algo, token=None):
+        """ a RemoteWorker for every slot of the worker at <address>, raises OSError or ProtocolError """
+        first = cls(address, algo, token)
+        return [first] + [cls(address, algo, token) for _ in range(first.slots - 1)]
+
+    def run(self, request, dirs, describe):
+        """
+        <request>: the "run" message, its inputs are [path, digest, mode] of the files the command is known to read
+        <dirs>: directories of the project, sent when they aren't the ones sent last
+        <describe>(paths): [path, digest, mode] of the ones of <paths> that exist
+        returns the "done" message, the files the command wrote are written to their paths.
+        raises WorkerLost
+        """
+        if self.lost:
+            raise WorkerLost(f"{self.address}: lost")
+        try:
+            if dirs is not self.dirs:
+                self.conn.send({"op": "dirs", "dirs": dirs})
+                self.dirs = dirs
+            return self._run(request, describe)
+        except (OSError, ProtocolError, ValueError, KeyError) as e:
+            self.lost = True
+            self.conn.close()
+            raise WorkerLost(f"{self.address}: {e}")
+
+    def _run(self, request, describe):
+        root = os.path.normpath(request["root"])
+        paths = {digest: path for path, digest, _ in request["inputs"]}
+        self.conn.send(dict(request, op="run"))
+        while True:
+            header = self.conn.recv()
+            op = header.get("op")
+            if op == "want":
+                for digest in header["digests"]:
+                    self.conn.send_file({"op": "blob", "digest": digest}, paths[digest])
+            elif op == "need":
+                found = describe(header["paths"])
+                paths.update((digest, path) for path, digest, _ in found)
+                self.conn.send({"op": "inputs", "inputs": found})
+            elif op == "done":
+                for _ in range(header["n_outputs"]):
+                    self._receive_output(self.conn.recv("output"), root)
+                return header
+            else:
+                raise ProtocolError(f"unexpected {op}")
+
+    def _receive_output(self, header, root):
+        path = _rebase(header["path"], root, root)
+        if path is None:
+            raise ProtocolError(f"output {header['path']} is out of {root}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                self.conn.recv_file(header["size"], f)
+            os.chmod(tmp, header["mode"])
+            # never write through <path>, it might be linked to a cache blob
+            os.rename(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
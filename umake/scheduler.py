@@ -0,0 +1,81 @@
+"""How many of the ready commands of a build start now: job, memory and [pool:...] limits."""
+import os
+import time
+
+# seconds between reads of the load average
+LOAD_CHECK_INTERVAL = 1.0
+
+
+def cpu_count():
+    """ cpus this process may run on """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parse_jobs(value):
+    """ (jobs, auto) of "auto" or a number, raises ValueError if it is neither """
+    if str(value).strip() == "auto":
+        return cpu_count(), True
+    jobs = int(value)
+    if jobs < 1:
+        raise ValueError(f"jobs should be a positive number or auto, got {value}")
+    return jobs, False
+
+
+def _load_average():
+    try:
+        return os.getloadavg()[0]
+    except OSError:
+        return 0.0
+
+
+class JobLimits:
+
+    def __init__(self, jobs, auto=False, memory_limit_kb=0, pools=None):
+        self.jobs = jobs
+        self.auto = auto
+        self.memory_limit_kb = memory_limit_kb
+        # pool name -> its depth
+        self.pools = pools or dict()
+        self.n_running = 0
+        self.rss_running_kb = 0
+        # pool name -> its commands running
+        self.pool_running = dict()
+        self.limit = jobs
+        self.checked_at = None
+
+    def current_limit(self):
+        if not self.auto:
+            return self.jobs
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= LOAD_CHECK_INTERVAL:
+            self.checked_at = now
+            # the commands running are part of the load
+            others_load = max(0.0, _load_average() - self.n_running)
+            self.limit = max(1, self.jobs - int(others_load))
+        return self.limit
+
+    def is_full(self):
+        return self.n_running >= self.current_limit()
+
+    def admit(self, rss_kb, pool=None):
+        """ a command of peak memory <rss_kb> in <pool> can start now """
+        if pool is not None and self.pool_running.get(pool, 0) >= self.pools.get(pool, 1):
+            return False
+        if self.memory_limit_kb and self.n_running and self.rss_running_kb + rss_kb > self.memory_limit_kb:
+            return False
+        return True
+
+    def start(self, rss_kb, pool=None):
+        self.n_running += 1
+        self.rss_running_kb += rss_kb
+        if pool is not None:
+            self.pool_running[pool] = self.pool_running.get(pool, 0) + 1
+
+    def finish(self, rss_kb, pool=None):
+        self.n_running -= 1
+        self.rss_running_kb -= rss_kb
+        if pool is not None:
+            self.pool_running[pool] -= 1
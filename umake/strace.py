@@ -0,0 +1,67 @@
+"""Parsing of `strace -f -e open,openat` output, line by line as it is written."""
+import re
+
+_CALL = re.compile(r'^(\d+)\s+(open|openat)\((?:[^,"]*, )?"((?:[^"\\]|\\.)*)"(.*)$')
+# with -f a call interrupted by another process is split in two lines:
+#   1168 openat(AT_FDCWD, "/usr/lib/libopcodes.so", O_RDONLY|O_CLOEXEC <unfinished ...>
+#   1168 <... openat resumed>) = 3
+_RESUMED = re.compile(r'^(\d+)\s+<\.\.\. (open|openat) resumed>(.*)$')
+_RC = re.compile(r'\)\s+=\s+(-?\d+)')
+_ESCAPE = re.compile(r'\\(.)')
+_ESCAPES = {"n": "\n", "t": "\t"}
+_WRITE_FLAGS = ("O_WRONLY", "O_RDWR", "O_CREAT", "O_TRUNC")
+
+
+def _unescape(path):
+    if "\\" not in path:
+        return path
+    return _ESCAPE.sub(lambda match: _ESCAPES.get(match.group(1), match.group(1)), path)
+
+
+class StraceParser:
+
+    def __init__(self, keep_failed=False):
+        # pid -> (path, flags) of a call waiting for its resumed line
+        self.unfinished = dict()
+        # paths that failed to open (a header not found on the include path), when <keep_failed>
+        self.failed = set() if keep_failed else None
+
+    @staticmethod
+    def _is_write(flags):
+        return any(flag in flags for flag in _WRITE_FLAGS)
+
+    @staticmethod
+    def _is_ok(rest):
+        match = _RC.search(rest)
+        return match is not None and int(match.group(1)) >= 0
+
+    def _add_failed(self, path):
+        if self.failed is not None:
+            self.failed.add(path)
+
+    def feed(self, line):
+        """ returns (path, opened_for_write) of a successful open, None for anything else """
+        match = _CALL.match(line)
+        if match is not None:
+            pid, _, path, rest = match.groups()
+            path = _unescape(path)
+            if rest.rstrip().endswith("<unfinished ...>"):
+                self.unfinished[pid] = (path, rest)
+                return None
+            if not self._is_ok(rest):
+                self._add_failed(path)
+                return None
+            return path, self._is_write(rest)
+
+        match = _RESUMED.match(line)
+        if match is not None:
+            pid, _, rest = match.groups()
+            try:
+                path, flags = self.unfinished.pop(pid)
+            except KeyError:
+                return None
+            if not self._is_ok(rest):
+                self._add_failed(path)
+                return None
+            return path, self._is_write(flags + rest)
+        return None
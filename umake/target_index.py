@@ -0,0 +1,81 @@
+"""Index of the targets of the UMakefile commands by directory, to match source patterns against."""
+import bisect
+import re
+from itertools import chain
+
+from umake.pywildcard import compile_pattern
+
+MAGIC = re.compile(r"[*?[]")
+# can match a "/", the pattern reaches into subdirectories
+CROSSES_DIRS = re.compile(r"\*\*|[?[/]")
+
+
+def _dirname(path):
+    return path.rpartition("/")[0]
+
+
+class TargetIndex:
+    """ the set of targets, with match() """
+
+    def __init__(self, targets=()):
+        self.targets = set()
+        # directory -> its targets
+        self.dirs = dict()
+        self.sorted_dirs = []
+        self.update(targets)
+
+    def add(self, target):
+        if target in self.targets:
+            return
+        self.targets.add(target)
+        dirname = _dirname(target)
+        try:
+            self.dirs[dirname].add(target)
+        except KeyError:
+            self.dirs[dirname] = {target}
+            bisect.insort(self.sorted_dirs, dirname)
+
+    def update(self, targets):
+        for target in targets:
+            self.add(target)
+
+    def intersection(self, targets):
+        return self.targets.intersection(targets)
+
+    def __contains__(self, target):
+        return target in self.targets
+
+    def __iter__(self):
+        return iter(self.targets)
+
+    def __len__(self):
+        return len(self.targets)
+
+    def _dirs_under(self, dirname):
+        """ <dirname> and its subdirectories """
+        idx = bisect.bisect_left(self.sorted_dirs, dirname)
+        prefix = dirname + "/"
+        while idx < len(self.sorted_dirs):
+            candidate = self.sorted_dirs[idx]
+            if not candidate.startswith(dirname):
+                break
+            if candidate == dirname or candidate.startswith(prefix):
+                yield candidate
+            idx += 1
+
+    def match(self, pattern):
+        """ the targets umake.pywildcard.fnmatch(target, <pattern>) is true for """
+        magic = MAGIC.search(pattern)
+        if magic is None:
+            return {pattern} if pattern in self.targets else set()
+        literal = pattern[:magic.start()]
+        if "/" not in literal:
+            candidates = self.targets
+        else:
+            dirname = _dirname(literal)
+            if CROSSES_DIRS.search(pattern, len(dirname) + 1):
+                candidates = chain.from_iterable(self.dirs[subdir] for subdir in self._dirs_under(dirname))
+            else:
+                candidates = self.dirs.get(dirname, ())
+        match = compile_pattern(pattern).match
+        return {target for target in candidates if match(target)}
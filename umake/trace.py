@@ -0,0 +1,148 @@
+"""Build tracing: spans of the umake phases and of every command, written as a Chrome trace."""
+import json
+import os
+import selectors
+import threading
+import time
+
+PHASE = "phase"
+CMD = "cmd"
+CMD_PHASE = "cmd-phase"
+UPLOAD = "upload"
+# bytes read from the output pipes of a command at once
+READ_SIZE = 32 * 1024
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def set_arg(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.complete(self.name, self.cat, self.start, time.perf_counter() - self.start, self.args)
+
+    def set_arg(self, key, value):
+        self.args[key] = value
+
+
+class Tracer:
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events = list()
+        self.thread_names = dict()
+        self.t0 = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def set_thread_name(self, name):
+        with self.lock:
+            self.thread_names[threading.get_ident()] = name
+
+    def span(self, name, cat=PHASE, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def complete(self, name, cat, start, duration, args=None):
+        """ record a span that started at <start> (perf_counter) and took <duration> seconds """
+        if not self.enabled:
+            return
+        event = {"name": name, "cat": cat, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                 "ts": (start - self.t0) * 1e6, "dur": duration * 1e6}
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    def write(self, path):
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+            metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                        for tid, name in self.thread_names.items()]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self, top_n=10):
+        """ lines of the slowest commands, and the total time of each phase / command sub phase """
+        with self.lock:
+            events = list(self.events)
+        lines = list()
+        phases = [event for event in events if event["cat"] == PHASE]
+        if phases:
+            lines.append("phases:")
+            for event in phases:
+                lines.append(f"    {event['dur'] / 1e6:10.3f}[sec] {event['name']}")
+
+        totals = dict()
+        for event in events:
+            if event["cat"] == CMD_PHASE:
+                totals[event["name"]] = totals.get(event["name"], 0) + event["dur"]
+        if totals:
+            lines.append("commands time by phase (sum over all workers):")
+            for name, dur in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+                lines.append(f"    {dur / 1e6:10.3f}[sec] {name}")
+
+        cmds = sorted((event for event in events if event["cat"] == CMD), key=lambda event: event["dur"], reverse=True)
+        if cmds:
+            lines.append(f"slowest {min(top_n, len(cmds))} commands:")
+            for event in cmds[:top_n]:
+                args = event.get("args", {})
+                details = ""
+                if "cpu_sec" in args:
+                    details = f" cpu {args['cpu_sec']:.3f}[sec] maxrss {args['max_rss_kb']}[KB]"
+                lines.append(f"    {event['dur'] / 1e6:10.3f}[sec]{details} {event['name']}")
+        return lines
+
+
+def communicate(proc, on_wait=None, interval=3):
+    """ proc.communicate() of <proc> started with stdout and stderr pipes, the child is reaped with wait4.
+        <on_wait>() is called every <interval> seconds of no output.
+        returns (stdout, stderr, resource usage of the child and of the descendants it waited for) """
+    chunks = {proc.stdout: [], proc.stderr: []}
+    with selectors.DefaultSelector() as selector:
+        for pipe in chunks:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            events = selector.select(interval)
+            if not events and on_wait is not None:
+                on_wait()
+            for key, _ in events:
+                data = os.read(key.fd, READ_SIZE)
+                if data:
+                    chunks[key.fileobj].append(data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    # as Popen sets it, Popen won't wait for the child again
+    proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return b"".join(chunks[proc.stdout]), b"".join(chunks[proc.stderr]), rusage
+
+
+tracer = Tracer()
@@ -0,0 +1,181 @@
+"""Write-behind uploads to the remote cache, a bounded queue drained by a pool of uploader threads."""
+import threading
+import time
+from collections import Counter
+from queue import Queue, Empty
+
+from umake.trace import tracer, UPLOAD
+
+# seconds to wait for the interrupted uploads to return
+STOP_TIMEOUT = 10
+
+
+class UploadInterrupted(Exception):
+    """ the upload was running when the build stopped waiting for it, not a failure of the backend """
+    pass
+
+
+class _Interruptible:
+    """ file object reading <data> until <stop> is set, a backend sending it fails instead of storing part of it """
+
+    def __init__(self, data, stop):
+        self.data = data
+        self.stop = stop
+
+    def read(self, *args):
+        if self.stop.is_set():
+            raise UploadInterrupted("upload interrupted")
+        return self.data.read(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.data, name)
+
+
+class Uploader:
+
+    def __init__(self, n_workers, max_pending):
+        self.n_workers = n_workers
+        self.queue = Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.started = False
+        self.stop = threading.Event()
+        self.threads = []
+        # path -> queued and running uploads reading it
+        self.paths = Counter()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.start_time = None
+            self.n_done = 0
+            self.n_failed = 0
+            self.n_dropped = 0
+            self.bytes_done = 0
+
+    def _start(self):
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = time.monotonic()
+            if self.started:
+                return
+            self.started = True
+            # the threads of an earlier build might still be returning, they keep their event
+            self.stop = threading.Event()
+            self.threads = [threading.Thread(target=self._worker, args=(idx, self.stop), daemon=True)
+                            for idx in range(self.n_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, name, size, upload, paths=()):
+        """ upload() is called by an uploader thread, returns False if failed or the number of bytes sent,
+            blocks while the queue is full. <paths>: files upload() reads, see in_use() """
+        self._start()
+        with self.lock:
+            self.paths.update(paths)
+        self.queue.put((name, size, upload, paths))
+
+    def interruptible(self, data):
+        """ <data> for a backend to send, reading it fails once the uploads are stopped """
+        return _Interruptible(data, self.stop)
+
+    def in_use(self):
+        """ files read by the uploads queued or running """
+        with self.lock:
+            return set(self.paths)
+
+    def _release(self, paths):
+        with self.lock:
+            self.paths.subtract(paths)
+            for path in paths:
+                if self.paths[path] <= 0:
+                    del self.paths[path]
+
+    def _worker(self, idx, stop):
+        tracer.set_thread_name(f"uploader-{idx}")
+        while not stop.is_set():
+            item = self.queue.get()
+            if item is None:
+                # woken up by drain()
+                self.queue.task_done()
+                continue
+            name, size, upload, paths = item
+            try:
+                with tracer.span(name, UPLOAD, size=size):
+                    ok = upload()
+                with self.lock:
+                    if ok is False:
+                        # an upload interrupted by the end of the build is dropped, not failed
+                        if stop.is_set():
+                            self.n_dropped += 1
+                        else:
+                            self.n_failed += 1
+                    else:
+                        self.n_done += 1
+                        # the number of bytes sent, if not <size>
+                        self.bytes_done += size if ok is True or ok is None else ok
+            except Exception:
+                with self.lock:
+                    if stop.is_set():
+                        self.n_dropped += 1
+                    else:
+                        self.n_failed += 1
+            finally:
+                self._release(paths)
+                self.queue.task_done()
+
+    def pending(self):
+        """ uploads waiting in the queue """
+        return self.queue.qsize()
+
+    def rate(self):
+        """ uploaded bytes per second since the first upload """
+        with self.lock:
+            if self.start_time is None:
+                return 0
+            elapsed = time.monotonic() - self.start_time
+            return self.bytes_done / elapsed if elapsed > 0 else 0
+
+    def drain(self, timeout):
+        """ wait for the queued uploads, after <timeout> seconds the ones waiting are dropped and the running
+            ones interrupted. The uploader threads are stopped, submit() starts them again """
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.queue.all_tasks_done.wait(remaining)
+        with self.lock:
+            self.stop.set()
+            threads = self.threads
+            self.started = False
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item is not None:
+                with self.lock:
+                    self.n_dropped += 1
+                self._release(item[3])
+            self.queue.task_done()
+        for _ in threads:
+            self.queue.put(None)
+        # a backend blocked on the network returns by its own timeout, its paths stay in_use() until then
+        stop_deadline = time.monotonic() + STOP_TIMEOUT
+        for thread in threads:
+            thread.join(max(0, stop_deadline - time.monotonic()))
+        # left by the threads that were uploading
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+            self.queue.task_done()
+
+    def stats_line(self):
+        rate = self.rate()
+        with self.lock:
+            return (f"remote uploads: {self.n_done} done {self.bytes_done / 1024 / 1024:.1f}MB "
+                    f"{rate / 1024 / 1024:.2f}MB/s, queue {self.queue.qsize()}, "
+                    f"failed {self.n_failed}, dropped {self.n_dropped}")
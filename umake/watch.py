@@ -0,0 +1,194 @@
+"""Watch mode: a long living umake that keeps the graph in memory and builds for clients."""
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import socket
+import struct
+import sys
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# a file in the directory changed
+CHANGE_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+# the set of files in the directory changed
+STRUCTURE_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+WATCH_MASK = CHANGE_MASK | STRUCTURE_MASK | IN_ONLYDIR
+
+_EVENT = struct.Struct("iIII")
+# client -> server: one json line {"targets": [...], "variant": ...}
+# server -> client: the build output, then a last line "UMAKE-STATUS <rc>"
+STATUS_PREFIX = "UMAKE-STATUS "
+
+
+class Changes:
+
+    def __init__(self):
+        # changed files
+        self.paths = set()
+        # files added, removed or renamed
+        self.structure_paths = set()
+        # directories added, removed or renamed
+        self.structure_changed = False
+        # events were lost, everything has to be checked
+        self.overflow = False
+
+
+class Inotify:
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        self.wd_to_dir = dict()
+        self.dir_to_wd = dict()
+
+    def add_watch(self, dirname):
+        """ returns False if the directory can't be watched (not exists, out of watches) """
+        if dirname in self.dir_to_wd:
+            return True
+        wd = self._add_watch(self.fd, os.fsencode(dirname), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES, errno.ENOSPC):
+                return False
+            raise OSError(err, f"inotify_add_watch {dirname}: {os.strerror(err)}")
+        self.wd_to_dir[wd] = dirname
+        self.dir_to_wd[dirname] = wd
+        return True
+
+    def read(self, changes: Changes):
+        """ add the pending events to <changes> """
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + name_len].rstrip(b"\0"))
+                offset += name_len
+                if mask & IN_Q_OVERFLOW:
+                    changes.overflow = True
+                    continue
+                dirname = self.wd_to_dir.get(wd)
+                if dirname is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # directory was removed
+                    del self.wd_to_dir[wd]
+                    self.dir_to_wd.pop(dirname, None)
+                    changes.structure_changed = True
+                    continue
+                path = os.path.join(dirname, name) if name else dirname
+                changes.paths.add(path)
+                if mask & STRUCTURE_MASK:
+                    if mask & IN_ISDIR or not name:
+                        changes.structure_changed = True
+                    else:
+                        changes.structure_paths.add(path)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _SocketWriter:
+    """ file like object sending the build output to the client, a client that went away is ignored """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+
+    def write(self, data):
+        if self.closed:
+            return len(data)
+        try:
+            self.conn.sendall(data.encode("utf-8", errors="replace"))
+        except OSError:
+            self.closed = True
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def serve(sock_path, build):
+    """ run build(request, output) for every client request, output is a file like object sent to the client """
+    try:
+        os.unlink(sock_path)
+    except FileNotFoundError:
+        pass
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(sock_path)
+    server.listen(8)
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                request = json.loads(conn.makefile("r").readline() or "{}")
+                writer = _SocketWriter(conn)
+                rc = build(request, writer)
+                writer.write(f"{STATUS_PREFIX}{rc}\n")
+    finally:
+        server.close()
+        try:
+            os.unlink(sock_path)
+        except FileNotFoundError:
+            pass
+
+
+def client(sock_path, request):
+    """ request a build from the server, prints its output, returns the build exit code """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(sock_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"umake --watch is not running in {os.getcwd()}", file=sys.stderr)
+        return 2
+    rc = 1
+    with conn:
+        conn.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        for line in conn.makefile("r", encoding="utf-8", errors="replace"):
+            if STATUS_PREFIX in line:
+                # the build output might not end with a newline
+                line, _, status = line.partition(STATUS_PREFIX)
+                rc = int(status)
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    return rc
+
+
+def client_main(argv):
+    """ umake --client [targets] [--variant <variant>], without loading anything of the build itself """
+    import argparse
+    parser = argparse.ArgumentParser(prog="umake --client")
+    parser.add_argument("--client", action="store_true")
+    parser.add_argument("targets", type=str, nargs="*", help="target path")
+    parser.add_argument("-v", "--variant", action="store", dest="variant", help="compile with diffrent variants")
+    args = parser.parse_args(argv)
+    from umake.colored_output import UMAKE_WATCH_SOCKET
+    return client(UMAKE_WATCH_SOCKET, {"targets": args.targets, "variant": args.variant})